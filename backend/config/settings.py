@@ -25,6 +25,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'rest_framework',
     'corsheaders',
@@ -36,6 +37,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'config.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -165,5 +167,35 @@ CELERY_RESULT_BACKEND = 'redis://redis:6379/0'
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 
+# Listagem de pessoas em cache: invalidada a cada escrita (ver persons/caching.py)
+PERSON_LIST_CACHE_TTL = int(os.environ.get('PERSON_LIST_CACHE_TTL', 60 * 60))
+# Cache de cada pessoa (retrieve e cálculo do peso ideal), invalidado na edição/exclusão
+PERSON_CACHE_TTL = int(os.environ.get('PERSON_CACHE_TTL', 60 * 60))
+# Cálculo do peso ideal em lote: máximo de ids ou pares (sexo, altura) por requisição
+IDEAL_WEIGHT_BATCH_MAX = int(os.environ.get('IDEAL_WEIGHT_BATCH_MAX', 10000))
+# Inclusão/alteração/exclusão em lote: máximo de itens por requisição
+PERSON_BULK_MAX = int(os.environ.get('PERSON_BULK_MAX', 1000))
+# Respostas comprimidas com brotli: qualidade de 0 a 11 (mais alta, menor e mais lenta)
+RESPONSE_BROTLI_QUALITY = int(os.environ.get('RESPONSE_BROTLI_QUALITY', 5))
+# Importação CSV: quantidade de linhas validadas e gravadas por transação
+IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 1000))
+# Arquivos com mais linhas que isso são divididos em shards processados em paralelo
+IMPORT_SHARD_SIZE = int(os.environ.get('IMPORT_SHARD_SIZE', 50000))
+# Quantidade de mensagens de erro devolvidas no resultado (o restante fica no relatório CSV)
+IMPORT_MAX_ERRORS = int(os.environ.get('IMPORT_MAX_ERRORS', 100))
+# Exportação: linhas buscadas por vez no cursor do servidor
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 2000))
+# Arquivos exportados mais antigos que isso (em horas) são removidos
+EXPORT_RETENTION_HOURS = int(os.environ.get('EXPORT_RETENTION_HOURS', 24))
+# Exportação incremental: por quantos dias os registros de exclusão são mantidos
+TOMBSTONE_RETENTION_DAYS = int(os.environ.get('TOMBSTONE_RETENTION_DAYS', 30))
+# Engines de importação/exportação: 'orm' (Django ORM) ou 'copy' (COPY do PostgreSQL)
+IMPORT_ENGINE = os.environ.get('IMPORT_ENGINE', 'orm')
+EXPORT_ENGINE = os.environ.get('EXPORT_ENGINE', 'orm')
+# Engine 'copy': linhas carregadas por COPY na tabela temporária a cada transação
+IMPORT_COPY_CHUNK_SIZE = int(os.environ.get('IMPORT_COPY_CHUNK_SIZE', 20000))
+# Intervalo mínimo (segundos) entre publicações do estado PROGRESS no Redis
+TASK_PROGRESS_INTERVAL = float(os.environ.get('TASK_PROGRESS_INTERVAL', 1.0))
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
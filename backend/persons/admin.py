@@ -5,10 +5,10 @@ from .models import Person
 class PersonAdmin(admin.ModelAdmin):
     list_display = (
         'id', 'name', 'date_of_birth', 'cpf', 
-        'sex', 'height', 'weight', 'ideal_weight')
+        'sex', 'height', 'weight', 'ideal_weight', 'bmi', 'weight_gap')
     
     search_fields = ('name', 'cpf')
     
     list_filter = ('sex',)
 
-    readonly_fields = ('ideal_weight',)
+    readonly_fields = ('ideal_weight', 'bmi', 'weight_gap')
@@ -0,0 +1,198 @@
+import asyncio
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Versão atual do namespace da listagem: incrementá-la invalida todas as páginas de uma vez
+PERSON_LIST_VERSION_KEY = 'persons:list:version'
+# Momento (timestamp) da última troca de versão, usado no Last-Modified da listagem
+PERSON_LIST_MODIFIED_KEY = 'persons:list:modified'
+
+# Cache por pessoa: a chave combina uma época global (trocada pelas gravações em
+# lote, que não informam os ids) com a versão da própria pessoa (trocada a cada
+# edição/exclusão). Uma leitura antiga gravada depois da troca fica órfã.
+PERSON_EPOCH_KEY = 'persons:detail:epoch'
+
+# Coalescência de misses: só quem obtém o lock consulta o banco; os demais aguardam
+PERSON_FILL_LOCK_TTL = 10
+PERSON_FILL_WAIT = 2.0
+PERSON_FILL_POLL = 0.02
+
+
+def _initial_version():
+    # Semeada pelo relógio (em microssegundos): se a chave for despejada do Redis,
+    # a nova versão nunca coincide com a de entradas antigas ainda em cache
+    return time.time_ns() // 1000
+
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), None)
+        version = cache.get(key)
+    return version
+
+
+async def _aget_version(key):
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, _initial_version(), None)
+        version = await cache.aget(key)
+    return version
+
+
+def _bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, _initial_version(), None)
+
+
+def person_list_version():
+    return _get_version(PERSON_LIST_VERSION_KEY)
+
+
+def bump_person_list_version():
+    """
+    Invalida a listagem em cache. Chamado a cada escrita em Person
+    (criação, edição, exclusão e importação em lote).
+    """
+    _bump_version(PERSON_LIST_VERSION_KEY)
+    cache.set(PERSON_LIST_MODIFIED_KEY, time.time(), None)
+
+
+async def aperson_list_state():
+    """
+    Versão atual da listagem e o timestamp da última alteração (ou None),
+    lidos numa única ida ao Redis, para as views async.
+    """
+    values = await cache.aget_many([PERSON_LIST_VERSION_KEY, PERSON_LIST_MODIFIED_KEY])
+    version = values.get(PERSON_LIST_VERSION_KEY) or await _aget_version(PERSON_LIST_VERSION_KEY)
+    return version, values.get(PERSON_LIST_MODIFIED_KEY)
+
+
+def person_list_cache_key(request, version=None):
+    """
+    Chave da página da listagem: versão atual + URL completa (host, busca e cursor).
+    Não depende de sessão/cookie, então a mesma página é compartilhada entre usuários.
+    """
+    if version is None:
+        version = person_list_version()
+    url = hashlib.sha1(request.build_absolute_uri().encode('utf-8')).hexdigest()
+    return f"persons:list:v{version}:{url}"
+
+
+def _person_version_key(person_id):
+    return f"persons:detail:{person_id}:version"
+
+
+def bump_person_version(person_id):
+    """
+    Invalida o cache de uma pessoa (edição ou exclusão).
+    """
+    _bump_version(_person_version_key(person_id))
+
+
+def bump_person_epoch():
+    """
+    Invalida o cache de todas as pessoas (gravações em lote, como o upsert da importação).
+    """
+    _bump_version(PERSON_EPOCH_KEY)
+
+
+def person_cache_key(person_id):
+    version_key = _person_version_key(person_id)
+    versions = cache.get_many([PERSON_EPOCH_KEY, version_key])
+    epoch = versions.get(PERSON_EPOCH_KEY) or _get_version(PERSON_EPOCH_KEY)
+    version = versions.get(version_key) or _get_version(version_key)
+    return f"persons:detail:{person_id}:e{epoch}:v{version}"
+
+
+async def aperson_cache_key(person_id):
+    version_key = _person_version_key(person_id)
+    versions = await cache.aget_many([PERSON_EPOCH_KEY, version_key])
+    epoch = versions.get(PERSON_EPOCH_KEY) or await _aget_version(PERSON_EPOCH_KEY)
+    version = versions.get(version_key) or await _aget_version(version_key)
+    return f"persons:detail:{person_id}:e{epoch}:v{version}"
+
+
+def cache_person(person):
+    """
+    Grava a pessoa já atualizada no cache, evitando o miss da próxima leitura.
+    """
+    cache.set(person_cache_key(person.pk), person, settings.PERSON_CACHE_TTL)
+
+
+def get_cached_person(person_id, loader):
+    """
+    Read-through: devolve a pessoa do cache ou chama `loader()` e guarda o
+    resultado. Misses simultâneos do mesmo id viram uma única consulta: quem
+    obtém o lock (cache.add) consulta o banco e os demais aguardam o valor.
+    Exceções do `loader` (como Person.DoesNotExist) não são guardadas.
+    """
+    try:
+        person_id = int(person_id)
+    except (TypeError, ValueError):
+        return loader()
+
+    key = person_cache_key(person_id)
+    person = cache.get(key)
+    if person is not None:
+        return person
+
+    lock_key = f"{key}:lock"
+    if not cache.add(lock_key, 1, PERSON_FILL_LOCK_TTL):
+        deadline = time.monotonic() + PERSON_FILL_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(PERSON_FILL_POLL)
+            person = cache.get(key)
+            if person is not None:
+                return person
+            if cache.get(lock_key) is None:
+                # Quem tinha o lock terminou sem gravar (ex.: pessoa inexistente)
+                break
+        return loader()
+
+    try:
+        person = loader()
+        cache.set(key, person, settings.PERSON_CACHE_TTL)
+        return person
+    finally:
+        cache.delete(lock_key)
+
+
+async def aget_cached_person(person_id, loader):
+    """
+    Versão assíncrona de `get_cached_person`: `loader()` devolve um awaitable
+    (ex.: Person.objects.aget) e a espera pelo lock não bloqueia o event loop.
+    """
+    try:
+        person_id = int(person_id)
+    except (TypeError, ValueError):
+        return await loader()
+
+    key = await aperson_cache_key(person_id)
+    person = await cache.aget(key)
+    if person is not None:
+        return person
+
+    lock_key = f"{key}:lock"
+    if not await cache.aadd(lock_key, 1, PERSON_FILL_LOCK_TTL):
+        deadline = time.monotonic() + PERSON_FILL_WAIT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(PERSON_FILL_POLL)
+            person = await cache.aget(key)
+            if person is not None:
+                return person
+            if await cache.aget(lock_key) is None:
+                break
+        return await loader()
+
+    try:
+        person = await loader()
+        await cache.aset(key, person, settings.PERSON_CACHE_TTL)
+        return person
+    finally:
+        await cache.adelete(lock_key)
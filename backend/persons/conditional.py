@@ -0,0 +1,69 @@
+import hashlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def person_etag(person):
+    """
+    ETag forte de uma pessoa, derivado de `updated_at` (em microssegundos):
+    muda a cada gravação, sem precisar serializar o registro.
+    """
+    return f'"{(person.updated_at - EPOCH) // timedelta(microseconds=1)}"'
+
+
+def etag_matches(header, etag, weak=False):
+    """
+    Compara o ETag com um cabeçalho If-Match / If-None-Match (lista ou `*`).
+    A comparação fraca (`weak`) ignora o prefixo W/ colocado por quem
+    comprime a resposta (CompressionMiddleware); como os bytes descomprimidos
+    são os mesmos, serve também para o If-Match.
+    """
+    etags = parse_etags(header)
+    if weak:
+        etags = [value.removeprefix('W/') for value in etags]
+    return '*' in etags or etag in etags
+
+
+def representation_etag(etag, request):
+    """
+    ETag da representação negociada: fora do JSON (ex.: MessagePack) os bytes
+    são outros, então o formato entra no valor.
+    """
+    renderer_format = getattr(getattr(request, 'accepted_renderer', None), 'format', 'json')
+    if renderer_format == 'json':
+        return etag
+    return f'{etag[:-1]}-{renderer_format}"'
+
+
+def person_list_etag(cache_key):
+    """
+    ETag forte de uma página da listagem: a chave de cache já combina a versão
+    da tabela com a URL (busca, filtros e cursor).
+    """
+    return f'"{hashlib.sha1(cache_key.encode("utf-8")).hexdigest()[:32]}"'
+
+
+def is_not_modified(request, etag, last_modified=None):
+    """
+    GET condicional: o If-None-Match tem precedência; sem ele, compara o
+    If-Modified-Since com `last_modified` (timestamp, precisão de segundos).
+    """
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag, weak=True)
+
+    if_modified_since = request.headers.get('If-Modified-Since')
+    if if_modified_since and last_modified is not None:
+        since = parse_http_date_safe(if_modified_since)
+        return since is not None and int(last_modified) <= since
+    return False
+
+
+def validator_headers(etag, last_modified=None):
+    headers = {'ETag': etag}
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(last_modified)
+    return headers
@@ -0,0 +1,139 @@
+import csv
+import gzip
+import io
+import json
+
+from .models import PERSON_FIELDS, Person
+from .serializers import person_row_data
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Colunas lidas do banco para a exportação (na ordem das tuplas de cada lote).
+# As métricas de peso já vêm calculadas do banco.
+EXPORT_FIELDS = PERSON_FIELDS
+EXPORT_HEADER = ['Nome', 'Data de Nascimento', 'CPF', 'Sexo', 'Altura', 'Peso', 'Peso Ideal']
+
+
+class CsvExportWriter:
+    """
+    CSV UTF-8 com cabeçalho em português (formato original da exportação).
+    Os writers recebem um arquivo binário e escrevem nele lote a lote;
+    `close()` finaliza o formato sem fechar o arquivo.
+    As linhas terminam em LF, como no COPY do PostgreSQL (engine `copy`): os
+    dois engines geram o mesmo arquivo, byte a byte, para o mesmo fingerprint.
+    """
+    extension = 'csv'
+
+    def __init__(self, fileobj):
+        self.stream = io.TextIOWrapper(fileobj, encoding='utf-8', newline='')
+        self.writer = csv.writer(self.stream, lineterminator='\n')
+        self.sex_display = dict(Person.SEX_CHOICES)
+
+    def write_header(self):
+        self.writer.writerow(EXPORT_HEADER)
+
+    def write_batch(self, rows):
+        self.writer.writerows(
+            (name, date_of_birth, cpf, self.sex_display.get(sex, sex), height, weight, ideal)
+            for _, name, date_of_birth, cpf, sex, height, weight, ideal, _, _ in rows
+        )
+
+    def close(self):
+        self.stream.flush()
+        self.stream.detach()
+
+
+class GzipCsvExportWriter(CsvExportWriter):
+    """
+    O mesmo CSV, comprimido com gzip durante a escrita.
+    """
+    extension = 'csv.gz'
+
+    def __init__(self, fileobj):
+        self.gzip = gzip.GzipFile(fileobj=fileobj, mode='wb')
+        super().__init__(self.gzip)
+
+    def close(self):
+        super().close()
+        self.gzip.close()
+
+
+class JsonLinesExportWriter:
+    """
+    JSON Lines: um objeto por linha, idêntico ao da API (`person_row_data`),
+    gerado com orjson quando disponível.
+    """
+    extension = 'jsonl'
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+
+    def write_header(self):
+        pass
+
+    def write_batch(self, rows):
+        if orjson is not None:
+            lines = (orjson.dumps(person_row_data(row)) for row in rows)
+        else:
+            lines = (
+                json.dumps(person_row_data(row), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+                for row in rows
+            )
+        self.fileobj.write(b''.join(line + b'\n' for line in lines))
+
+    def close(self):
+        pass
+
+
+class ParquetExportWriter:
+    """
+    Parquet (colunar), um row group por lote, com os mesmos campos da API.
+    """
+    extension = 'parquet'
+
+    def __init__(self, fileobj):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("A exportação em Parquet requer o pacote pyarrow.")
+
+        self.pa = pa
+        self.schema = pa.schema([
+            ('id', pa.int64()),
+            ('name', pa.string()),
+            ('date_of_birth', pa.date32()),
+            ('cpf', pa.string()),
+            ('sex', pa.string()),
+            ('height', pa.decimal128(3, 2)),
+            ('weight', pa.decimal128(5, 2)),
+            ('ideal_weight', pa.float64()),
+            ('bmi', pa.float64()),
+            ('weight_gap', pa.float64()),
+        ])
+        self.writer = pq.ParquetWriter(fileobj, self.schema, compression='snappy')
+
+    def write_header(self):
+        pass
+
+    def write_batch(self, rows):
+        columns = list(zip(*rows))
+        # Métricas de peso: Decimal no banco, float64 no arquivo (como na API)
+        for index in range(7, 10):
+            columns[index] = [float(value) for value in columns[index]]
+        arrays = [self.pa.array(values, type=field.type) for field, values in zip(self.schema, columns)]
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+EXPORT_FORMATS = {
+    'csv': CsvExportWriter,
+    'csv.gz': GzipCsvExportWriter,
+    'jsonl': JsonLinesExportWriter,
+    'parquet': ParquetExportWriter,
+}
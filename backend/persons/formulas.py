@@ -0,0 +1,120 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+TWO_PLACES = Decimal('0.01')
+
+# Alturas aceitas pelo cadastro (Person.height): 0.50 a 2.50 m, de centímetro em centímetro
+HEIGHT_MIN = Decimal('0.50')
+HEIGHT_MAX = Decimal('2.50')
+HEIGHTS = [HEIGHT_MIN + Decimal(step) * TWO_PLACES for step in range(int((HEIGHT_MAX - HEIGHT_MIN) / TWO_PLACES) + 1)]
+
+METERS_PER_INCH = Decimal('0.0254')
+
+
+def _linear(factor, offset):
+    # Fórmulas em metros: (fator * altura) - deslocamento
+    return lambda height: factor * height - offset
+
+
+def _per_inch_over_five_feet(base, per_inch):
+    # Fórmulas clássicas em polegadas: base + kg por polegada acima de 5 pés (60")
+    return lambda height: base + per_inch * (height / METERS_PER_INCH - 60)
+
+
+class IdealWeightFormula:
+    """
+    Fórmula de peso ideal por sexo, com a tabela de resultados pré-calculada
+    para todas as alturas possíveis do cadastro (2 x 201 valores). O cálculo
+    de cada pessoa vira uma consulta ao dicionário.
+    """
+
+    def __init__(self, name, male, female):
+        self.name = name
+        self.functions = {'M': male, 'F': female}
+        self.table = {
+            (sex, height): self.compute(sex, height)
+            for sex in self.functions for height in HEIGHTS
+        }
+
+    def compute(self, sex, height):
+        """
+        Aplica a fórmula sem usar a tabela, em Decimal, arredondando como o
+        ROUND do PostgreSQL (meio para cima), o mesmo das colunas recalculadas
+        em SQL. Sexo diferente de 'M' usa a fórmula feminina.
+        Na fórmula padrão, o antigo `round()` de float diferia em um centésimo
+        em 19 das 402 combinações de sexo e altura, onde o resultado termina
+        em 5 (ex: M 1.65 m passou de 61.95 para 61.96; F 1.75 m, de 63.97 para 63.98).
+        """
+        function = self.functions['M' if sex == 'M' else 'F']
+        return function(Decimal(str(height))).quantize(TWO_PLACES, ROUND_HALF_UP)
+
+    def ideal_weight(self, sex, height):
+        if not isinstance(height, Decimal):
+            height = Decimal(str(height))
+        value = self.table.get(('M' if sex == 'M' else 'F', height))
+        if value is None:
+            # Altura fora da tabela (ainda não validada): calcula na hora
+            value = self.compute(sex, height)
+        return value
+
+    def ideal_weights(self, sexes, heights):
+        """
+        Versão em lote de `ideal_weight`, sobre colunas de sexo e altura.
+        """
+        return [self.ideal_weight(sex, height) for sex, height in zip(sexes, heights)]
+
+
+DEFAULT_FORMULA = 'default'
+
+# Fórmula padrão por sexo, (fator, deslocamento): também usada nas expressões SQL
+# que recalculam as colunas gravadas (Person.weight_metric_expressions)
+DEFAULT_COEFFICIENTS = {
+    'M': (Decimal('72.7'), Decimal('58')),
+    'F': (Decimal('62.1'), Decimal('44.7')),
+}
+
+FORMULAS = {
+    formula.name: formula for formula in (
+        # Fórmula original do sistema, gravada em Person.ideal_weight
+        IdealWeightFormula(
+            DEFAULT_FORMULA,
+            male=_linear(*DEFAULT_COEFFICIENTS['M']),
+            female=_linear(*DEFAULT_COEFFICIENTS['F']),
+        ),
+        # Devine (1974)
+        IdealWeightFormula(
+            'devine',
+            male=_per_inch_over_five_feet(Decimal('50'), Decimal('2.3')),
+            female=_per_inch_over_five_feet(Decimal('45.5'), Decimal('2.3')),
+        ),
+        # Robinson (1983)
+        IdealWeightFormula(
+            'robinson',
+            male=_per_inch_over_five_feet(Decimal('52'), Decimal('1.9')),
+            female=_per_inch_over_five_feet(Decimal('49'), Decimal('1.7')),
+        ),
+        # Miller (1983)
+        IdealWeightFormula(
+            'miller',
+            male=_per_inch_over_five_feet(Decimal('56.2'), Decimal('1.41')),
+            female=_per_inch_over_five_feet(Decimal('53.1'), Decimal('1.36')),
+        ),
+        # Hamwi (1964)
+        IdealWeightFormula(
+            'hamwi',
+            male=_per_inch_over_five_feet(Decimal('48'), Decimal('2.7')),
+            female=_per_inch_over_five_feet(Decimal('45.5'), Decimal('2.2')),
+        ),
+    )
+}
+
+
+def get_formula(name=None):
+    """
+    Devolve a fórmula pelo nome (a padrão quando vazio). Levanta ValueError se não existir.
+    """
+    if not name:
+        return FORMULAS[DEFAULT_FORMULA]
+    try:
+        return FORMULAS[name]
+    except KeyError:
+        raise ValueError(f"Fórmula de peso ideal inválida. Use: {', '.join(FORMULAS)}.")
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.27 on 2026-10-18 12:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('persons', '0002_alter_person_cpf'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PersonTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('person_id', models.BigIntegerField()),
+                ('cpf', models.CharField(max_length=14)),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['updated_at', 'id'], name='person_updated_at_id_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.27 on 2026-10-18 12:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('persons', '0003_person_updated_at_index_tombstone'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['created_at', 'id'], name='person_created_at_id_idx'),
+        ),
+    ]
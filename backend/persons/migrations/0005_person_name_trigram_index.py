@@ -0,0 +1,20 @@
+# Generated by Django 4.2.27 on 2026-10-18 12:45
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('persons', '0004_person_created_at_index'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='person',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='person_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
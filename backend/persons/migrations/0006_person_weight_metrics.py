@@ -0,0 +1,57 @@
+# Generated by Django 4.2.27 on 2026-10-18 13:05
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+# Preenche as colunas das pessoas já cadastradas com as mesmas fórmulas de
+# Person.update_weight_metrics (ROUND do PostgreSQL = ROUND_HALF_UP)
+BACKFILL_SQL = """
+UPDATE persons_person SET
+    ideal_weight = ROUND(CASE WHEN sex = 'M' THEN (72.7 * height) - 58
+                              ELSE (62.1 * height) - 44.7 END, 2),
+    bmi = ROUND(weight / (height * height), 2);
+UPDATE persons_person SET weight_gap = weight - ideal_weight;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('persons', '0005_person_name_trigram_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='person',
+            name='ideal_weight',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0'), editable=False, max_digits=5),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='bmi',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0'), editable=False, max_digits=6),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='weight_gap',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0'), editable=False, max_digits=5),
+            preserve_default=False,
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['ideal_weight', 'id'], name='person_ideal_weight_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['bmi', 'id'], name='person_bmi_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['weight_gap', 'id'], name='person_weight_gap_id_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.27 on 2026-10-18 14:10
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('persons', '0006_person_weight_metrics'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='person',
+            name='person_name_trgm_idx',
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='gin_trgm_ops'), name='person_name_upper_trgm_idx'),
+        ),
+    ]
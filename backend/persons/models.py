@@ -1,16 +1,31 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
+from django.db.models import Case, ExpressionWrapper, Value, When
+from django.db.models.functions import Round, Upper
+from django.db.models.lookups import Exact
 from django.core.validators import MinValueValidator, MaxValueValidator
-from decimal import Decimal
+from decimal import Decimal, ROUND_HALF_UP
 
+from .formulas import DEFAULT_COEFFICIENTS, FORMULAS, DEFAULT_FORMULA, TWO_PLACES
 from .validators import validate_cpf_numbers
 
 
+# Campos públicos de Person, na ordem da API (PersonSerializer) e das exportações
+PERSON_FIELDS = (
+    'id', 'name', 'date_of_birth', 'cpf', 'sex', 'height', 'weight',
+    'ideal_weight', 'bmi', 'weight_gap'
+)
+
+
 class Person(models.Model):
     SEX_CHOICES = [
         ('M', 'Masculino'),
         ('F', 'Feminino'),
     ]
 
+    # Colunas derivadas de sexo, altura e peso, recalculadas a cada gravação
+    WEIGHT_METRIC_FIELDS = ('ideal_weight', 'bmi', 'weight_gap')
+
     name = models.CharField(max_length=150)
     date_of_birth = models.DateField()
     cpf = models.CharField(
@@ -34,25 +49,92 @@ class Person(models.Model):
             MaxValueValidator(Decimal(300.00))]
     )
 
+    # Peso ideal, IMC e diferença (peso - peso ideal) gravados no banco, para
+    # filtrar, ordenar e agregar em SQL. Mantidos por `update_weight_metrics`.
+    ideal_weight = models.DecimalField(max_digits=5, decimal_places=2, editable=False)
+    bmi = models.DecimalField(max_digits=6, decimal_places=2, editable=False)
+    weight_gap = models.DecimalField(max_digits=5, decimal_places=2, editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Exportação incremental: busca por (updated_at, id) > checkpoint
+            models.Index(fields=['updated_at', 'id'], name='person_updated_at_id_idx'),
+            # Paginação por cursor da listagem: ordem (created_at, id)
+            models.Index(fields=['created_at', 'id'], name='person_created_at_id_idx'),
+            # Busca por parte do nome: o `icontains` do Django gera
+            # UPPER("name"::text) LIKE UPPER('%termo%'), então o índice é sobre UPPER(name)
+            GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='person_name_upper_trgm_idx'),
+            # Filtros e ordenação da listagem pelas métricas de peso (id como desempate)
+            models.Index(fields=['ideal_weight', 'id'], name='person_ideal_weight_id_idx'),
+            models.Index(fields=['bmi', 'id'], name='person_bmi_id_idx'),
+            models.Index(fields=['weight_gap', 'id'], name='person_weight_gap_id_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.cpf})"
 
-    @property
-    def ideal_weight(self):
+    def save(self, *args, **kwargs):
+        self.update_weight_metrics()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'sex', 'height', 'weight'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, *self.WEIGHT_METRIC_FIELDS}
+        super().save(*args, **kwargs)
+
+    def update_weight_metrics(self):
         """
-        Calcula o peso ideal baseado na fórmula:
+        Recalcula peso ideal, IMC e diferença de peso. Chamado pelo `save` e,
+        nas gravações em lote (que não passam pelo `save`), antes do bulk_create.
+        """
+        height = Decimal(str(self.height))
+        weight = Decimal(str(self.weight))
+        self.ideal_weight = self.calculate_ideal_weight(self.sex, height)
+        self.bmi = (weight / (height * height)).quantize(TWO_PLACES, ROUND_HALF_UP)
+        self.weight_gap = weight - self.ideal_weight
+
+    @staticmethod
+    def weight_metric_expressions(sex, height, weight):
+        """
+        Peso ideal, IMC e diferença de peso como expressões SQL, com o mesmo
+        arredondamento de `update_weight_metrics`, a partir de expressões de
+        sexo, altura e peso (F() para a coluna gravada, Value() para o valor novo).
+        """
+        decimal = models.DecimalField()
+        (male_factor, male_offset), (female_factor, female_offset) = (
+            DEFAULT_COEFFICIENTS['M'], DEFAULT_COEFFICIENTS['F']
+        )
+        ideal_weight = Round(Case(
+            When(Exact(sex, 'M'), then=Value(male_factor) * height - Value(male_offset)),
+            default=Value(female_factor) * height - Value(female_offset),
+            output_field=decimal,
+        ), 2)
+        return {
+            'ideal_weight': ideal_weight,
+            'bmi': Round(ExpressionWrapper(weight / (height * height), output_field=decimal), 2),
+            'weight_gap': ExpressionWrapper(weight - ideal_weight, output_field=decimal),
+        }
+
+    @staticmethod
+    def calculate_ideal_weight(sex, height):
+        """
+        Calcula o peso ideal pela fórmula padrão:
         Homens: (72.7 * height) - 58
         Mulheres: (62.1 * height) - 44.7
+        O valor vem da tabela pré-calculada (ver persons/formulas.py).
         """
-        height_float = float(self.height)
-        
-        if self.sex == 'M':
-            ideal_weight = (72.7 * height_float) - 58
-        else:
-            ideal_weight = (62.1 * height_float) - 44.7
-            
-        return round(ideal_weight, 2)
+        return FORMULAS[DEFAULT_FORMULA].ideal_weight(sex, height)
 
+
+class PersonTombstone(models.Model):
+    """
+    Registro de uma pessoa excluída, para que a exportação incremental
+    consiga informar as exclusões aos consumidores.
+    """
+    person_id = models.BigIntegerField()
+    cpf = models.CharField(max_length=14)
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.person_id} ({self.cpf})"
@@ -0,0 +1,143 @@
+import json
+from base64 import b64decode, b64encode
+from datetime import datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Field, Func, Value
+from django.db.models.functions import Cast
+from django.db.models.lookups import GreaterThan, LessThan
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+class RowValue(Func):
+    """
+    Construtor de linha do SQL, `(a, b)`, para comparar várias colunas de uma vez.
+    """
+    template = '(%(expressions)s)'
+    output_field = Field()
+
+
+class PersonCursorPagination(CursorPagination):
+    """
+    Paginação por cursor (keyset) para a listagem de pessoas.
+    O cursor guarda os valores de todas as colunas da ordenação na borda da
+    página, e a página seguinte é filtrada pela comparação de linha
+    `(created_at, id) < (%s, %s)`, atendida pelo índice em (created_at, id):
+    páginas profundas custam o mesmo que a primeira e empates na primeira
+    coluna não repetem nem pulam registros.
+    Todas as colunas da ordenação seguem a mesma direção.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.fields = [field.lstrip('-') for field in self.ordering]
+        self.output_fields = [self._output_field(queryset, field) for field in self.fields]
+        position, reverse = self.decode_cursor(request)
+
+        ordering = self.ordering
+        if reverse:
+            ordering = [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+        if position is not None:
+            queryset = queryset.filter(self._keyset_lookup(position, forward=not reverse))
+
+        rows = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        return self.page
+
+    @staticmethod
+    def _output_field(queryset, name):
+        annotation = queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        return queryset.model._meta.get_field(name)
+
+    def _keyset_lookup(self, position, forward):
+        descending = self.ordering[0].startswith('-')
+        lookup = LessThan if forward == descending else GreaterThan
+        values = [
+            Cast(Value(value, output_field=output_field), output_field)
+            for value, output_field in zip(position, self.output_fields)
+        ]
+        return lookup(RowValue(*self.fields), RowValue(*values))
+
+    def _position(self, row):
+        return [getattr(row, field) for field in self.fields]
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self._position(self.page[-1]), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self._position(self.page[0]), reverse=True)
+
+    def encode_cursor(self, position, reverse=False):
+        values = [
+            value.isoformat() if isinstance(value, datetime) else str(value) if isinstance(value, Decimal) else value
+            for value in position
+        ]
+        payload = json.dumps({'p': values, 'r': int(reverse)}, separators=(',', ':'))
+        encoded = b64encode(payload.encode('utf-8'), altchars=b'-_').decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        """
+        Devolve (posição, reverso) do cursor da URL, ou (None, False) sem cursor.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            payload = json.loads(b64decode(encoded.encode('ascii'), altchars=b'-_', validate=True))
+            values = payload['p']
+            if len(values) != len(self.fields):
+                raise ValueError
+            position = [
+                output_field.to_python(value) for value, output_field in zip(values, self.output_fields)
+            ]
+            return position, bool(payload.get('r'))
+        except (KeyError, TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class PersonRankedCursorPagination(PersonCursorPagination):
+    """
+    Paginação por cursor da busca ordenada por relevância (similaridade do nome),
+    com o id como desempate: nomes iguais têm a mesma similaridade.
+    """
+    ordering = ('-similarity', '-id')
+
+
+class PersonMetricCursorPagination(PersonCursorPagination):
+    """
+    Paginação por cursor ordenada por uma métrica de peso gravada no banco
+    (`ideal_weight`, `bmi` ou `weight_gap`, com `-` para decrescente), com o id
+    como desempate, pelos índices (métrica, id).
+    """
+    metric_fields = ('ideal_weight', 'bmi', 'weight_gap')
+
+    def __init__(self, ordering):
+        field = ordering.removeprefix('-')
+        if field not in self.metric_fields:
+            raise ValueError(f"Ordenação inválida. Use: {', '.join(self.metric_fields)} (ou -campo).")
+        self.ordering = (ordering, '-id' if ordering.startswith('-') else 'id')
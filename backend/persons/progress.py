@@ -0,0 +1,82 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+PROGRESS_STATE = 'PROGRESS'
+
+# Tempo de vida dos contadores no cache (o suficiente para a task mais longa)
+PROGRESS_TTL = 60 * 60 * 24
+
+
+class TaskProgress:
+    """
+    Publica o andamento de uma task como estado PROGRESS no result backend.
+
+    Os contadores ficam no cache (Redis), com incremento atômico, para que
+    vários shards da mesma importação somem no mesmo task id. A publicação
+    é limitada a uma escrita a cada TASK_PROGRESS_INTERVAL segundos por processo.
+    """
+
+    def __init__(self, task, task_id):
+        self.task = task
+        self.task_id = task_id
+        self.interval = settings.TASK_PROGRESS_INTERVAL
+        self.last_published = 0.0
+
+    def _key(self, name):
+        return f"task-progress:{self.task_id}:{name}"
+
+    def start(self, total=None):
+        """
+        Registra o início da task e, se conhecido, o total de linhas.
+        """
+        if not self.task_id:
+            return
+        cache.add(self._key('started_at'), time.time(), PROGRESS_TTL)
+        cache.add(self._key('processed'), 0, PROGRESS_TTL)
+        cache.add(self._key('errors'), 0, PROGRESS_TTL)
+        if total is not None:
+            cache.set(self._key('total'), total, PROGRESS_TTL)
+        self.publish(force=True)
+
+    def advance(self, rows, errors=0):
+        """
+        Soma as linhas processadas (e os erros) e publica se o intervalo permitir.
+        """
+        if not self.task_id:
+            return
+        if rows:
+            cache.incr(self._key('processed'), rows)
+        if errors:
+            cache.incr(self._key('errors'), errors)
+        self.publish()
+
+    def snapshot(self):
+        values = cache.get_many([
+            self._key(name) for name in ('started_at', 'processed', 'total', 'errors')
+        ])
+        started_at = values.get(self._key('started_at')) or time.time()
+        processed = values.get(self._key('processed')) or 0
+        total = values.get(self._key('total'))
+        elapsed = max(time.time() - started_at, 1e-6)
+        rate = processed / elapsed
+
+        eta = None
+        if total is not None and rate > 0:
+            eta = round(max(total - processed, 0) / rate, 1)
+
+        return {
+            "processed": processed,
+            "total": total,
+            "errors": values.get(self._key('errors')) or 0,
+            "rows_per_sec": round(rate, 1),
+            "eta_seconds": eta,
+        }
+
+    def publish(self, force=False):
+        now = time.monotonic()
+        if not force and now - self.last_published < self.interval:
+            return
+        self.last_published = now
+        self.task.update_state(task_id=self.task_id, state=PROGRESS_STATE, meta=self.snapshot())
@@ -0,0 +1,72 @@
+import math
+
+from rest_framework.renderers import BaseRenderer, BrowsableAPIRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def _has_non_finite(data):
+    if isinstance(data, float):
+        return not math.isfinite(data)
+    if isinstance(data, dict):
+        return any(_has_non_finite(value) for value in data.values())
+    if isinstance(data, (list, tuple)):
+        return any(_has_non_finite(value) for value in data)
+    return False
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer do DRF acelerado com orjson. Gera os mesmos bytes da versão
+    padrão (compacta, UTF-8, com \\u2028/\\u2029 escapados, datas/horas pelo
+    encoder do DRF). Com indentação, NaN/infinito, dados que o orjson não
+    aceita ou sem o pacote instalado, usa o JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if orjson is None or indent is not None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            # Datas/horas passam pelo encoder do DRF (ex.: `Z` no lugar de `+00:00`)
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # O orjson grava NaN/infinito como null; o DRF recusa (STRICT_JSON) ou grava NaN
+        if b'null' in ret and _has_non_finite(data):
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Resposta em MessagePack (`Accept: application/msgpack` ou `?format=msgpack`),
+    mais compacta e barata de decodificar que o JSON. Os tipos que o msgpack
+    não conhece (Decimal, datas...) são convertidos como no JSON do DRF.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=JSONEncoder().default, use_bin_type=True)
+
+
+# Renderers negociados pelo PersonViewSet: MessagePack só com o pacote instalado
+PERSON_RENDERER_CLASSES = [ORJSONRenderer, BrowsableAPIRenderer] + ([MessagePackRenderer] if msgpack else [])
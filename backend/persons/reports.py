@@ -0,0 +1,73 @@
+import csv
+import io
+import tempfile
+from collections import Counter
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+
+ERROR_REPORT_HEADER = ['Linha', 'Tipo', 'Mensagem']
+
+
+class ImportErrorReport:
+    """
+    Acumula os erros de uma importação com memória limitada.
+
+    Mantém apenas as primeiras IMPORT_MAX_ERRORS mensagens e a contagem por
+    tipo de erro; o relatório completo é escrito em um arquivo temporário,
+    linha a linha, e salvo no default_storage ao final.
+    """
+
+    def __init__(self, max_errors=None):
+        self.max_errors = settings.IMPORT_MAX_ERRORS if max_errors is None else max_errors
+        self.first_errors = []
+        self.counts = Counter()
+        self.total = 0
+        self._file = None
+        self._writer = None
+
+    def add(self, line, kind, message):
+        if self._file is None:
+            self._file = tempfile.TemporaryFile('w+', encoding='utf-8', newline='')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(ERROR_REPORT_HEADER)
+
+        self._writer.writerow([line, kind, message])
+        self.counts[kind] += 1
+        self.total += 1
+        if len(self.first_errors) < self.max_errors:
+            self.first_errors.append(message)
+
+    def merge(self, summary):
+        """
+        Incorpora o resumo (`as_dict`) de outro relatório, como o de um shard,
+        copiando o arquivo dele para este e removendo-o do storage.
+        """
+        if summary["error_file"]:
+            with default_storage.open(summary["error_file"], 'rb') as part:
+                reader = csv.reader(io.TextIOWrapper(part, encoding='utf-8', newline=''))
+                next(reader, None)
+                for line, kind, message in reader:
+                    self.add(line, kind, message)
+            default_storage.delete(summary["error_file"])
+
+    def save(self, name):
+        """
+        Salva o relatório completo no storage. Retorna o caminho, ou None se não houve erros.
+        """
+        if self._file is None:
+            return None
+        self._file.seek(0)
+        path = default_storage.save(name, File(self._file))
+        self._file.close()
+        self._file = None
+        return path
+
+    def as_dict(self, error_file=None):
+        return {
+            "errors": self.first_errors,
+            "error_count": self.total,
+            "error_types": dict(self.counts),
+            "error_file": error_file,
+        }
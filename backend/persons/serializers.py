@@ -1,22 +1,272 @@
 import re
+from decimal import Decimal
 
+from django.conf import settings
 from rest_framework import serializers
-from .models import Person
+from rest_framework.validators import UniqueValidator
+from .formulas import DEFAULT_FORMULA, FORMULAS, TWO_PLACES
+from .models import PERSON_FIELDS, Person
 from .validators import validate_cpf_numbers
 
 
+class PersonListSerializer(serializers.ListSerializer):
+    """
+    Validação em lote (`PersonSerializer(many=True)`). A unicidade do CPF é
+    verificada com uma única consulta `IN` para o lote inteiro (e entre os
+    próprios itens), em vez de uma consulta por item. Nas alterações,
+    `instance` é a lista de pessoas já carregadas e cada item é validado
+    contra a pessoa do seu `id`.
+    """
+
+    def run_child_validation(self, data):
+        if self.instance is None:
+            return super().run_child_validation(data)
+
+        if not hasattr(self, '_instances'):
+            self._instances = {person.pk: person for person in self.instance}
+        instances = self._instances
+        try:
+            person_id = int(data.get('id'))
+        except (AttributeError, TypeError, ValueError):
+            raise serializers.ValidationError({'id': ["Informe o id da pessoa."]})
+        if person_id not in instances:
+            raise serializers.ValidationError({'id': ["Pessoa não encontrada."]})
+
+        self.child.instance = instances[person_id]
+        self.child.initial_data = data
+        validated = super().run_child_validation(data)
+        validated['id'] = person_id
+        return validated
+
+    def to_internal_value(self, data):
+        validated = super().to_internal_value(data)
+
+        cpfs = [item['cpf'] for item in validated]
+        taken = dict(Person.objects.filter(cpf__in=cpfs).values_list('cpf', 'id'))
+        seen_cpfs, seen_ids, errors = set(), set(), []
+        for item in validated:
+            error = {}
+            if item['cpf'] in seen_cpfs:
+                error['cpf'] = ["CPF repetido no lote."]
+            elif item['cpf'] in taken and taken[item['cpf']] != item.get('id'):
+                error['cpf'] = ["Já existe uma pessoa com este CPF."]
+            if 'id' in item and item['id'] in seen_ids:
+                error['id'] = ["Pessoa repetida no lote."]
+            seen_cpfs.add(item['cpf'])
+            seen_ids.add(item.get('id'))
+            errors.append(error)
+
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return validated
+
+
 class PersonSerializer(serializers.ModelSerializer):
-    ideal_weight = serializers.ReadOnlyField()
+    """
+    Com `fields` (ex.: `?fields=`), só esses campos são serializados.
+    """
+    # Colunas calculadas na gravação (Person.update_weight_metrics), expostas como número
+    ideal_weight = serializers.FloatField(read_only=True)
+    bmi = serializers.FloatField(read_only=True)
+    weight_gap = serializers.FloatField(read_only=True)
 
     class Meta:
         model = Person
-        fields = [
-            'id', 'name', 'date_of_birth', 'cpf', 
-            'sex', 'height', 'weight', 'ideal_weight'
-        ]
+        fields = list(PERSON_FIELDS)
+        list_serializer_class = PersonListSerializer
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if isinstance(self.parent, PersonListSerializer):
+            # Em lote, a unicidade do CPF é verificada de uma vez pelo PersonListSerializer
+            fields['cpf'].validators = [
+                validator for validator in fields['cpf'].validators
+                if not isinstance(validator, UniqueValidator)
+            ]
+        return fields
 
     def validate_cpf(self, value):
         clean_cpf = re.sub(r'[^0-9]', '', str(value))
         validate_cpf_numbers(clean_cpf)
         return clean_cpf
 
+    def to_representation(self, instance):
+        """
+        Com outra fórmula no contexto (`formula`, um IdealWeightFormula), peso
+        ideal e diferença de peso vêm da tabela dela em vez das colunas gravadas.
+        """
+        data = super().to_representation(instance)
+        formula = self.context.get('formula')
+        if formula is not None and formula.name != DEFAULT_FORMULA:
+            ideal_weight = formula.ideal_weight(instance.sex, instance.height)
+            if 'ideal_weight' in data:
+                data['ideal_weight'] = float(ideal_weight)
+            if 'weight_gap' in data:
+                data['weight_gap'] = float(Decimal(str(instance.weight)) - ideal_weight)
+        return data
+
+
+def _decimal_representation(value):
+    # Mesmo formato do DecimalField do DRF (string com 2 casas)
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value))
+    return format(value.quantize(TWO_PLACES), 'f')
+
+
+def person_row_data(row, formula=None):
+    """
+    Converte uma tupla com as colunas de PERSON_FIELDS no mesmo dicionário
+    que PersonSerializer gera para a pessoa (inclusive com `formula`).
+    """
+    pk, name, date_of_birth, cpf, sex, height, weight, ideal_weight, bmi, weight_gap = row[:10]
+    if formula is not None and formula.name != DEFAULT_FORMULA:
+        ideal_weight = formula.ideal_weight(sex, height)
+        weight_gap = Decimal(str(weight)) - ideal_weight
+    return {
+        "id": pk,
+        "name": name,
+        "date_of_birth": date_of_birth if isinstance(date_of_birth, str) else date_of_birth.isoformat(),
+        "cpf": cpf,
+        "sex": sex,
+        "height": _decimal_representation(height),
+        "weight": _decimal_representation(weight),
+        "ideal_weight": float(ideal_weight),
+        "bmi": float(bmi),
+        "weight_gap": float(weight_gap),
+    }
+
+
+# Representação de cada coluna no caminho rápido (as demais saem como estão)
+FIELD_REPRESENTATIONS = {
+    'date_of_birth': lambda value: value if isinstance(value, str) else value.isoformat(),
+    'height': _decimal_representation,
+    'weight': _decimal_representation,
+    'ideal_weight': float,
+    'bmi': float,
+    'weight_gap': float,
+}
+
+
+def parse_fields(value):
+    """
+    Converte o parâmetro `fields` (nomes separados por vírgula) na tupla de
+    campos pedidos, na ordem de PERSON_FIELDS. Vazio ou ausente: None (todos).
+    """
+    if not value:
+        return None
+    requested = {name.strip() for name in value.split(',') if name.strip()}
+    invalid = requested - set(PERSON_FIELDS)
+    if invalid:
+        raise ValueError(
+            f"Campo(s) inválido(s) em fields: {', '.join(sorted(invalid))}. Use: {', '.join(PERSON_FIELDS)}."
+        )
+    return tuple(field for field in PERSON_FIELDS if field in requested) or None
+
+
+def person_read_columns(fields=None, formula=None):
+    """
+    Colunas a buscar no banco para gerar `fields`. Com outra fórmula, peso
+    ideal e diferença de peso são recalculados a partir de sexo, altura e peso.
+    """
+    if fields is None:
+        return PERSON_FIELDS
+    columns = list(fields)
+    if formula is not None and formula.name != DEFAULT_FORMULA and {'ideal_weight', 'weight_gap'} & set(fields):
+        columns += [field for field in ('sex', 'height', 'weight') if field not in columns]
+    return tuple(columns)
+
+
+def person_row_fields(row, fields, formula=None):
+    """
+    Como `person_row_data`, mas só com `fields`, lendo as colunas pelo nome
+    (tupla nomeada do values_list ou a própria instância).
+    """
+    data = {}
+    for field in fields:
+        value = getattr(row, field)
+        representation = FIELD_REPRESENTATIONS.get(field)
+        data[field] = value if representation is None else representation(value)
+
+    if formula is not None and formula.name != DEFAULT_FORMULA and ('ideal_weight' in data or 'weight_gap' in data):
+        ideal_weight = formula.ideal_weight(row.sex, row.height)
+        if 'ideal_weight' in data:
+            data['ideal_weight'] = float(ideal_weight)
+        if 'weight_gap' in data:
+            data['weight_gap'] = float(Decimal(str(row.weight)) - ideal_weight)
+    return data
+
+
+class PersonReadSerializer:
+    """
+    Caminho rápido, só de leitura, para saídas `many=True` (listagem e lotes).
+    Em vez da árvore de campos do DRF, converte direto as tuplas de um
+    values_list (colunas de PERSON_FIELDS, extras ao final são ignorados).
+    O resultado é idêntico ao de `PersonSerializer(many=True).data`.
+    Com `fields`, as tuplas são nomeadas e trazem as colunas de
+    `person_read_columns(fields, formula)`.
+    """
+
+    def __init__(self, rows, formula=None, fields=None):
+        self.rows = rows
+        self.formula = formula
+        self.fields = fields
+
+    @classmethod
+    def from_instances(cls, people, formula=None, fields=None):
+        if fields is not None:
+            return cls(people, formula, fields)
+        return cls([tuple(getattr(person, field) for field in PERSON_FIELDS) for person in people], formula)
+
+    @property
+    def data(self):
+        if self.fields is not None:
+            return [person_row_fields(row, self.fields, self.formula) for row in self.rows]
+        return [person_row_data(row, self.formula) for row in self.rows]
+
+
+class IdealWeightBatchSerializer(serializers.Serializer):
+    """
+    Entrada do cálculo do peso ideal em lote, em colunas: `ids` de pessoas
+    cadastradas ou os pares avulsos `sex[i]`/`height[i]`.
+    """
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False, max_length=settings.IDEAL_WEIGHT_BATCH_MAX
+    )
+    sex = serializers.ListField(
+        child=serializers.ChoiceField(choices=Person.SEX_CHOICES),
+        required=False, max_length=settings.IDEAL_WEIGHT_BATCH_MAX
+    )
+    height = serializers.ListField(
+        child=serializers.DecimalField(
+            max_digits=3, decimal_places=2,
+            min_value=Decimal('0.50'), max_value=Decimal('2.50')
+        ),
+        required=False, max_length=settings.IDEAL_WEIGHT_BATCH_MAX
+    )
+
+    formula = serializers.ChoiceField(choices=list(FORMULAS), default=DEFAULT_FORMULA)
+
+    def validate(self, data):
+        has_pairs = 'sex' in data or 'height' in data
+        if ('ids' in data) == has_pairs:
+            raise serializers.ValidationError("Informe `ids` ou as listas `sex` e `height`.")
+        if has_pairs and len(data.get('sex', [])) != len(data.get('height', [])):
+            raise serializers.ValidationError("As listas `sex` e `height` devem ter o mesmo tamanho.")
+        return data
+
+
+class PersonBulkDeleteSerializer(serializers.Serializer):
+    """
+    Entrada da exclusão em lote: os ids das pessoas.
+    """
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False, max_length=settings.PERSON_BULK_MAX
+    )
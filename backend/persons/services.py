@@ -1,6 +1,33 @@
+import codecs
+import uuid
+from decimal import Decimal, InvalidOperation
+
+from asgiref.sync import sync_to_async
 from celery.result import AsyncResult
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+
+from .exporters import EXPORT_FORMATS
+from .formulas import DEFAULT_FORMULA, get_formula
+from .models import PERSON_FIELDS
+from .progress import PROGRESS_STATE
+from .tasks import (
+    PersonTask, StaleWriteError, EXPORT_FORMAT_CSV, IMPORT_MODES, import_persons_from_csv,
+    export_persons_to_csv, export_persons_delta_to_csv, export_lock_key, finished_export, parse_checkpoint
+)
 
-from .tasks import PersonTask, import_persons_from_csv, export_persons_to_csv
+# Tempo máximo que uma exportação fica marcada como "em andamento"
+EXPORT_LOCK_TTL = 60 * 60
+
+# Filtros da listagem pelas métricas de peso: parâmetro -> lookup no ORM
+LIST_RANGE_FILTERS = {
+    'min_ideal_weight': 'ideal_weight__gte',
+    'max_ideal_weight': 'ideal_weight__lte',
+    'min_bmi': 'bmi__gte',
+    'max_bmi': 'bmi__lte',
+    'min_weight_gap': 'weight_gap__gte',
+    'max_weight_gap': 'weight_gap__lte',
+}
 
 
 class PersonService:
@@ -12,74 +39,230 @@ class PersonService:
         return PersonTask.create(dto_data)
 
     @staticmethod
-    def handle_update(person_id, dto_data):
-        return PersonTask.update(person_id, dto_data)
+    def handle_update(person, dto_data, expected_updated_at=None):
+        return PersonTask.update(person, dto_data, expected_updated_at)
 
     @staticmethod
     def handle_delete(person_id):
         return PersonTask.delete(person_id)
 
     @staticmethod
-    def handle_search(filters, search_term):
-        return PersonTask.filter_people(filters, search_term)
+    def get_people_for_bulk_update(items):
+        """
+        Carrega, com uma única consulta, as pessoas citadas pelos itens (`id`)
+        de uma alteração em lote. Ids ausentes ou inválidos são reportados
+        item a item pela validação do serializer.
+        """
+        person_ids = set()
+        for item in items if isinstance(items, list) else []:
+            try:
+                person_ids.add(int(item.get('id')))
+            except (AttributeError, TypeError, ValueError):
+                continue
+        return list(PersonTask.get_many(person_ids).values())
+
+    @staticmethod
+    def handle_bulk_create(items):
+        return PersonTask.bulk_create(items)
+
+    @staticmethod
+    def handle_bulk_update(people, items):
+        """
+        Aplica cada item (já validado, com `id`) na pessoa correspondente.
+        """
+        people_by_id = {person.pk: person for person in people}
+        targets = [people_by_id[item['id']] for item in items]
+        changes = [{key: value for key, value in item.items() if key != 'id'} for item in items]
+        return PersonTask.bulk_update(targets, changes)
+
+    @staticmethod
+    def handle_bulk_delete(person_ids):
+        return PersonTask.bulk_delete(person_ids)
+
+    @staticmethod
+    def handle_search(filters, search_term, rank=False):
+        return PersonTask.filter_people(filters, search_term, rank)
+
+    @staticmethod
+    def get_read_rows(people, ordering, columns=PERSON_FIELDS):
+        return PersonTask.read_rows(people, ordering, columns)
+
+    @staticmethod
+    def parse_list_filters(query_params):
+        """
+        Converte os parâmetros min_/max_ (peso ideal, IMC e diferença de peso)
+        em filtros do ORM, executados no banco pelas colunas indexadas.
+        """
+        filters = {}
+        for param, lookup in LIST_RANGE_FILTERS.items():
+            value = query_params.get(param)
+            if value in (None, ''):
+                continue
+            try:
+                number = Decimal(value)
+            except InvalidOperation:
+                number = None
+            if number is None or not number.is_finite():
+                raise ValueError(f"Valor inválido para {param}.")
+            filters[lookup] = number
+        return filters
 
     @staticmethod
     def get_person_by_id(person_id):
         return PersonTask.get_by_id(person_id)
 
     @staticmethod
-    def get_ideal_weight_calculation(person_id):
+    async def aget_person_by_id(person_id):
+        return await PersonTask.aget_by_id(person_id)
+
+    @staticmethod
+    async def aget_ideal_weight_calculation(person_id, formula=None):
         """
         Lógica para o ponto extra solicitada na prova.
+        Pela fórmula padrão, o peso ideal já está gravado junto com a pessoa;
+        as demais fórmulas consultam a tabela pré-calculada (persons/formulas.py).
         """
-        person = PersonTask.get_by_id(person_id)
-        height = float(person.height)
-        
-        # Fórmulas exigidas: Homem: (72.7 * altura) - 58 | Mulher: (62.1 * altura) - 44.7
-        if person.sex == 'M':
-            ideal_weight = (72.7 * height) - 58
-        else:
-            ideal_weight = (62.1 * height) - 44.7
-            
-        return round(ideal_weight, 2)
+        formula = get_formula(formula)
+        return PersonService._ideal_weight_of(await PersonTask.aget_by_id(person_id), formula)
+
+    @staticmethod
+    def _ideal_weight_of(person, formula):
+        if formula.name == DEFAULT_FORMULA:
+            return float(person.ideal_weight)
+        return float(formula.ideal_weight(person.sex, person.height))
 
     @staticmethod
-    def handle_import_csv(file):
+    def get_ideal_weight_batch(person_ids, formula=None):
+        """
+        Peso ideal de várias pessoas cadastradas, em colunas. `id` e
+        `ideal_weight` seguem a ordem do pedido; ids inexistentes vão para `missing`.
         """
-        Lê o arquivo, extrai o conteúdo e dispara a task assíncrona.
+        stored = PersonTask.get_ideal_weights(person_ids, get_formula(formula))
+        found = [person_id for person_id in person_ids if person_id in stored]
+        return {
+            "id": found,
+            "ideal_weight": [float(stored[person_id]) for person_id in found],
+            "missing": [person_id for person_id in person_ids if person_id not in stored],
+        }
+
+    @staticmethod
+    def calculate_ideal_weight_batch(sexes, heights, formula=None):
+        """
+        Peso ideal de pares (sexo, altura) avulsos, na ordem recebida.
+        """
+        values = get_formula(formula).ideal_weights(sexes, heights)
+        return {"ideal_weight": [float(value) for value in values]}
+
+    @staticmethod
+    def handle_import_csv(file, mode='insert'):
+        """
+        Salva o arquivo no storage e dispara a task assíncrona com o caminho dele.
+        `mode` define o tratamento de CPFs já cadastrados (insert, upsert, skip-existing).
         Retorna o ID da tarefa para rastreamento.
         """
-        # 1. Lê o conteúdo do arquivo enviado (em memória)
+        if mode not in IMPORT_MODES:
+            raise ValueError(f"Modo de importação inválido. Use: {', '.join(IMPORT_MODES)}.")
+
+        # 1. Garante que o arquivo é UTF-8, decodificando em blocos (sem carregar tudo)
+        decoder = codecs.getincrementaldecoder('utf-8')()
         try:
-            file_content = file.read().decode('utf-8')
+            for chunk in file.chunks():
+                decoder.decode(chunk)
+            decoder.decode(b'', final=True)
         except UnicodeDecodeError:
             raise ValueError("O arquivo deve estar no formato UTF-8.")
 
-        # 2. Dispara a task do Celery (usa .delay() para ser assíncrono)
-        task = import_persons_from_csv.delay(file_content)
+        # 2. Grava o upload no storage compartilhado (mesmo volume das exportações)
+        file.seek(0)
+        file_path = default_storage.save(f"imports/{uuid.uuid4().hex}.csv", file)
+
+        # 3. Dispara a task do Celery apenas com a referência do arquivo
+        task = import_persons_from_csv.delay(file_path, mode=mode)
         
-        # 3. Retorna o ID da tarefa para o Controller informar ao Client
+        # 4. Retorna o ID da tarefa para o Controller informar ao Client
         return task.id
 
+    @staticmethod
+    def _get_progress(task_result):
+        """
+        Linhas processadas, total, linhas/s, ETA e erros publicados pela task.
+        """
+        if task_result.status == PROGRESS_STATE:
+            return task_result.info
+        return None
+
     @staticmethod
     def get_task_status(task_id):
         """
         Consulta o estado atual da tarefa no Redis.
         """
         task_result = AsyncResult(task_id)
-        return {
+        data = {
             "task_id": task_id,
             "status": task_result.status, # PENDING, PROGRESS, SUCCESS, FAILURE
-            "result": task_result.result if task_result.ready() else None
+            "progress": PersonService._get_progress(task_result),
+            "result": task_result.result if task_result.ready() else None,
+            "error_file_url": None
         }
+
+        # Relatório completo de erros (o resultado traz apenas os primeiros)
+        if task_result.ready() and task_result.status == 'SUCCESS':
+            error_file = task_result.result.get("error_file")
+            if error_file:
+                data["error_file_url"] = PersonService._media_url(error_file)
+
+        return data
     
     @staticmethod
-    def handle_export_csv():
+    async def aget_task_status(task_id):
         """
-        Inicia o processo de exportação assíncrona.
+        Versão assíncrona para as views async. O result backend do Celery só tem
+        API síncrona: a leitura roda no pool de threads (thread_sensitive=False,
+        não usa o banco), sem fila na thread compartilhada do ORM.
         """
-        task = export_persons_to_csv.delay()
-        return task.id
+        return await sync_to_async(PersonService.get_task_status, thread_sensitive=False)(task_id)
+
+    @staticmethod
+    def handle_export_csv(since=None, export_format='csv'):
+        """
+        Inicia o processo de exportação assíncrona no formato `export_format`
+        (csv, csv.gz, jsonl ou parquet).
+        Com `since` (checkpoint de uma exportação anterior), exporta apenas o
+        que mudou desde então, só em CSV (outro formato levanta ValueError). Sem ele, se os dados não mudaram desde a última
+        exportação (mesmo fingerprint), devolve o arquivo existente; se a mesma
+        exportação já está rodando, devolve a task em andamento.
+        """
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Formato inválido. Use: {', '.join(EXPORT_FORMATS)}.")
+
+        if since:
+            if export_format != EXPORT_FORMAT_CSV:
+                raise ValueError("A exportação incremental (`since`) só está disponível em csv.")
+            parse_checkpoint(since)
+            task = export_persons_delta_to_csv.delay(since)
+            return {"task_id": task.id, "file_url": None}
+
+        fingerprint = PersonTask.export_fingerprint()
+        file_path = finished_export(fingerprint, export_format)
+        if file_path:
+            return {
+                "task_id": None,
+                "file_url": PersonService._media_url(file_path),
+                "next_checkpoint": PersonTask.current_checkpoint()
+            }
+
+        task_id = uuid.uuid4().hex
+        lock_key = export_lock_key(fingerprint, export_format)
+        if not cache.add(lock_key, task_id, EXPORT_LOCK_TTL):
+            return {"task_id": cache.get(lock_key), "file_url": None}
+
+        export_persons_to_csv.apply_async(
+            kwargs={"fingerprint": fingerprint, "export_format": export_format}, task_id=task_id)
+        return {"task_id": task_id, "file_url": None}
+
+    @staticmethod
+    def _media_url(file_path):
+        return f"http://localhost:8080/media/{file_path}"
 
     @staticmethod
     def get_export_status(task_id):
@@ -89,11 +272,17 @@ class PersonService:
         task_result = AsyncResult(task_id)
         data = {
             "status": task_result.status,
+            "progress": PersonService._get_progress(task_result),
             "file_url": None
         }
         
         if task_result.ready() and task_result.status == 'SUCCESS':
             file_path = task_result.result.get("file_url")
-            data["file_url"] = f"http://localhost:8080/media/{file_path}"
+            data["file_url"] = PersonService._media_url(file_path)
+            data["next_checkpoint"] = task_result.result.get("next_checkpoint")
             
-        return data
\ No newline at end of file
+        return data
+
+    @staticmethod
+    async def aget_export_status(task_id):
+        return await sync_to_async(PersonService.get_export_status, thread_sensitive=False)(task_id)
@@ -0,0 +1,33 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .caching import bump_person_list_version, bump_person_version
+from .models import Person, PersonTombstone
+
+
+@receiver(post_delete, sender=Person)
+def create_tombstone(sender, instance, **kwargs):
+    """
+    Toda exclusão (API, admin ou em lote) deixa um tombstone para a exportação incremental.
+    """
+    PersonTombstone.objects.create(person_id=instance.pk, cpf=instance.cpf)
+
+
+@receiver(post_save, sender=Person)
+@receiver(post_delete, sender=Person)
+def invalidate_person_caches(sender, instance, **kwargs):
+    """
+    Invalida a listagem e o cache da pessoa após qualquer criação, edição ou
+    exclusão, depois do commit (como `_invalidate_people_on_commit`): dentro
+    da transação, uma leitura concorrente guardaria de novo a versão anterior.
+    As gravações em lote da importação (que não disparam sinais) invalidam o
+    cache diretamente.
+    """
+    person_id = instance.pk
+
+    def invalidate():
+        bump_person_list_version()
+        bump_person_version(person_id)
+
+    transaction.on_commit(invalidate)
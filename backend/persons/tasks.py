@@ -1,13 +1,113 @@
 import csv
+import hashlib
+import heapq
 import io
-from celery import shared_task
+import os
+import re
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+from celery import chord, group, shared_task
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.core.files.base import ContentFile
+from django.core.files.base import File
 from django.core.files.storage import default_storage
-from django.db.models import Q
-from .models import Person
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, FloatField, Max, Q, Value
+from django.db.models.functions import Cast
+from django.db.models.sql import UpdateQuery
+from django.utils import timezone
+from .caching import (
+    aget_cached_person, bump_person_epoch, bump_person_list_version, bump_person_version, cache_person,
+    get_cached_person
+)
+from .conditional import EPOCH
+from .exporters import CsvExportWriter, EXPORT_FIELDS, EXPORT_FORMATS, EXPORT_HEADER
+from .formulas import DEFAULT_FORMULA
+from .models import PERSON_FIELDS, Person, PersonTombstone
+from .progress import TaskProgress
+from .reports import ImportErrorReport
 from .validators import validate_cpf_numbers
 
+# Busca: termos formados só por dígitos e pontuação de CPF
+CPF_SEARCH_RE = re.compile(r'^[0-9.\-\s]+$')
+
+# Modos de importação: o que fazer quando o CPF da linha já está cadastrado
+IMPORT_MODE_INSERT = 'insert'
+IMPORT_MODE_UPSERT = 'upsert'
+IMPORT_MODE_SKIP_EXISTING = 'skip-existing'
+IMPORT_MODES = (IMPORT_MODE_INSERT, IMPORT_MODE_UPSERT, IMPORT_MODE_SKIP_EXISTING)
+
+# Campos gravados pela alteração em lote (bulk_update)
+BULK_UPDATE_FIELDS = [
+    'name', 'date_of_birth', 'cpf', 'sex', 'height', 'weight', *Person.WEIGHT_METRIC_FIELDS, 'updated_at'
+]
+
+# Campos sobrescritos no modo `upsert` (o CPF é a chave do conflito)
+IMPORT_UPDATE_FIELDS = [
+    'name', 'date_of_birth', 'sex', 'height', 'weight', *Person.WEIGHT_METRIC_FIELDS, 'updated_at'
+]
+
+# Exportação: de quantas em quantas linhas o andamento é contabilizado
+EXPORT_PROGRESS_STEP = 1000
+
+# Versão do layout do arquivo exportado: entra no fingerprint, então mudar o
+# formato invalida os arquivos já gerados
+EXPORT_FORMAT_VERSION = 2
+EXPORT_DIR = 'exports'
+EXPORT_FORMAT_CSV = 'csv'
+
+# Exportação incremental: operação de cada linha (U = inclusão/alteração, D = exclusão)
+DELTA_HEADER = ['Operação', 'ID', *EXPORT_HEADER, 'Atualizado em']
+DELTA_UPSERT = 'U'
+DELTA_DELETE = 'D'
+
+# Engines de importação/exportação: ORM do Django ou COPY do PostgreSQL
+ENGINE_ORM = 'orm'
+ENGINE_COPY = 'copy'
+
+# Engine `copy`: tabela temporária de carga e colunas enviadas pelo COPY
+COPY_STAGING_TABLE = 'persons_import_staging'
+# Colunas de que dependem as métricas de peso (Person.weight_metric_expressions)
+METRIC_SOURCE_FIELDS = ('sex', 'height', 'weight')
+
+COPY_IMPORT_FIELDS = ('name', 'date_of_birth', 'cpf', 'sex', 'height', 'weight', *Person.WEIGHT_METRIC_FIELDS)
+
+
+def _update_returning(queryset, values, returning):
+    """
+    `queryset.update(**values)` com RETURNING das colunas `returning` (o
+    Django 4.2 não oferece): devolve a linha gravada, ou None se o filtro não
+    encontrou nenhuma.
+    """
+    query = queryset.query.chain(UpdateQuery)
+    query.add_update_values(values)
+    sql, params = query.get_compiler(queryset.db).as_sql()
+    columns = ', '.join(connection.ops.quote_name(Person._meta.get_field(field).column) for field in returning)
+    with connection.cursor() as cursor:
+        cursor.execute(f"{sql} RETURNING {columns}", params)
+        return cursor.fetchone()
+
+
+def _invalidate_people_on_commit(person_ids):
+    """
+    Invalida a listagem e o cache das pessoas `person_ids` depois do commit,
+    para que nenhuma leitura concorrente guarde a versão anterior à transação.
+    """
+    def invalidate():
+        bump_person_list_version()
+        for person_id in person_ids:
+            bump_person_version(person_id)
+    transaction.on_commit(invalidate)
+
+
+class StaleWriteError(Exception):
+    """
+    A pessoa foi alterada por outra requisição depois da versão informada (If-Match).
+    """
+
 
 class PersonTask:
     """
@@ -18,11 +118,48 @@ class PersonTask:
         return Person.objects.create(**data)
 
     @staticmethod
-    def update(person_id, data):
-        person = Person.objects.get(pk=person_id)
-        for attr, value in data.items():
-            setattr(person, attr, value)
-        person.save()
+    def update(person, data, expected_updated_at=None):
+        """
+        Aplica `data` na pessoa já carregada e grava apenas os campos que
+        mudaram (mais as métricas de peso, se for o caso, e `updated_at`) com
+        um único UPDATE. As métricas são calculadas no SQL a partir da linha
+        gravada, e a pessoa recebe de volta sexo, altura, peso e métricas. Com `expected_updated_at`, o UPDATE só acontece se a
+        linha ainda estiver nessa versão; caso contrário levanta StaleWriteError.
+        """
+        changed = [attr for attr, value in data.items() if getattr(person, attr) != value]
+        if not changed:
+            return person
+
+        for attr in changed:
+            setattr(person, attr, data[attr])
+        person.updated_at = timezone.now()
+        values = {field: getattr(person, field) for field in [*changed, 'updated_at']}
+
+        people = Person.objects.filter(pk=person.pk)
+        if expected_updated_at is not None:
+            people = people.filter(updated_at=expected_updated_at)
+
+        if {'sex', 'height', 'weight'} & set(changed):
+            # As métricas são calculadas no próprio UPDATE, sobre a linha gravada
+            # (valores novos onde mudaram): a pessoa carregada (do cache, talvez
+            # antiga) não define as colunas que este PATCH não alterou
+            values.update(Person.weight_metric_expressions(*(
+                Value(data[field], output_field=Person._meta.get_field(field)) if field in changed else F(field)
+                for field in METRIC_SOURCE_FIELDS
+            )))
+            row = _update_returning(people, values, METRIC_SOURCE_FIELDS + Person.WEIGHT_METRIC_FIELDS)
+            if row is None:
+                raise StaleWriteError()
+            for field, value in zip(METRIC_SOURCE_FIELDS + Person.WEIGHT_METRIC_FIELDS, row):
+                setattr(person, field, value)
+        elif not people.update(**values):
+            raise StaleWriteError()
+
+        # O UPDATE direto não dispara o post_save: invalida o cache aqui e já
+        # grava a versão nova da pessoa
+        bump_person_list_version()
+        bump_person_version(person.pk)
+        cache_person(person)
         return person
 
     @staticmethod
@@ -30,84 +167,810 @@ class PersonTask:
         person = Person.objects.get(pk=person_id)
         person.delete()
 
+    @staticmethod
+    def get_many(person_ids):
+        """
+        Carrega várias pessoas com uma única consulta `IN`. Retorna {id: pessoa}.
+        """
+        return Person.objects.in_bulk(person_ids)
+
+    @staticmethod
+    @transaction.atomic
+    def bulk_create(items):
+        """
+        Inclui várias pessoas com um único INSERT. Como o bulk_create não passa
+        pelo `save` nem dispara sinais, as métricas de peso e a invalidação do
+        cache são feitas aqui.
+        """
+        people = [Person(**data) for data in items]
+        for person in people:
+            person.update_weight_metrics()
+        Person.objects.bulk_create(people)
+        _invalidate_people_on_commit([])
+        return people
+
+    @staticmethod
+    @transaction.atomic
+    def bulk_update(people, items):
+        """
+        Aplica `items[i]` em `people[i]` (já carregadas) e grava tudo com um
+        único UPDATE (bulk_update), invalidando o cache de cada pessoa.
+        """
+        now = timezone.now()
+        for person, data in zip(people, items):
+            for attr, value in data.items():
+                setattr(person, attr, value)
+            person.update_weight_metrics()
+            person.updated_at = now
+        Person.objects.bulk_update(people, BULK_UPDATE_FIELDS)
+        _invalidate_people_on_commit([person.pk for person in people])
+        return people
+
+    @staticmethod
+    @transaction.atomic
+    def bulk_delete(person_ids):
+        """
+        Exclui várias pessoas com um único DELETE ... WHERE id = ANY(...). O
+        RETURNING alimenta os tombstones (gravados de uma vez, no lugar do sinal
+        post_delete) e a invalidação do cache. Retorna os ids excluídos.
+        """
+        table = connection.ops.quote_name(Person._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {table} WHERE id = ANY(%s) RETURNING id, cpf", [list(person_ids)])
+            deleted = cursor.fetchall()
+
+        PersonTombstone.objects.bulk_create(
+            [PersonTombstone(person_id=pk, cpf=cpf) for pk, cpf in deleted]
+        )
+        deleted_ids = [pk for pk, _ in deleted]
+        if deleted_ids:
+            _invalidate_people_on_commit(deleted_ids)
+        return deleted_ids
+
     @staticmethod
     def get_by_id(person_id):
-        return Person.objects.get(pk=person_id)
+        return get_cached_person(person_id, lambda: Person.objects.get(pk=person_id))
+
+    @staticmethod
+    async def aget_by_id(person_id):
+        return await aget_cached_person(person_id, lambda: Person.objects.aget(pk=person_id))
+
+    @staticmethod
+    def get_ideal_weights(person_ids, formula):
+        """
+        Peso ideal de várias pessoas com uma única consulta `IN`, sem instanciar
+        o Model: a fórmula padrão lê a coluna gravada; as demais consultam a
+        tabela da fórmula com o sexo e a altura. Retorna {id: peso_ideal};
+        ids inexistentes ficam de fora.
+        """
+        people = Person.objects.filter(id__in=person_ids)
+        if formula.name == DEFAULT_FORMULA:
+            return dict(people.values_list('id', 'ideal_weight'))
+        return {
+            pk: formula.ideal_weight(sex, height)
+            for pk, sex, height in people.values_list('id', 'sex', 'height')
+        }
 
     @staticmethod
-    def filter_people(filters, search_term=None):
+    def filter_people(filters, search_term=None, rank=False):
+        """
+        Termos com cara de CPF (formatado ou não) viram uma busca exata pelo
+        índice único de `cpf`; os demais buscam no nome com `icontains`
+        (UPPER(name) LIKE UPPER('%termo%')), atendido pelo índice GIN
+        (pg_trgm) sobre UPPER(name). Com `rank`, anota a similaridade do nome
+        com o termo (`similarity`) para ordenar por relevância.
+        """
         queryset = Person.objects.filter(**filters)
-        if search_term:
-            queryset = queryset.filter(
-                Q(name__icontains=search_term) | Q(cpf=search_term)
-            )
+        if not search_term:
+            return queryset
+
+        search_term = search_term.strip()
+        cpf = re.sub(r'[^0-9]', '', search_term)
+        if CPF_SEARCH_RE.match(search_term) and len(cpf) == 11:
+            queryset = queryset.filter(cpf=cpf)
+            similarity = Value(1.0, output_field=FloatField())
+        else:
+            queryset = queryset.filter(name__icontains=search_term)
+            # similarity() devolve `real`; em double precision o valor lido volta
+            # idêntico no cursor da paginação (senão os empates repetem a página)
+            similarity = Cast(TrigramSimilarity('name', search_term), FloatField())
+
+        if rank:
+            queryset = queryset.annotate(similarity=similarity)
         return queryset
 
+    @staticmethod
+    def read_rows(queryset, ordering, columns=PERSON_FIELDS):
+        """
+        Converte a consulta em tuplas nomeadas (values_list) com as colunas
+        pedidas (por padrão, PERSON_FIELDS), mais as da ordenação (para a
+        paginação por cursor), sem instanciar o Model. O SELECT traz só elas.
+        """
+        extra = [field.lstrip('-') for field in ordering if field.lstrip('-') not in columns]
+        return queryset.values_list(*columns, *extra, named=True)
+
+    @staticmethod
+    def export_fingerprint():
+        """
+        Identifica o estado atual da tabela (quantidade, maior `updated_at` e
+        maior id) junto com a versão do formato, com uma única consulta.
+        """
+        stats = Person.objects.aggregate(
+            total=Count('id'), last_update=Max('updated_at'), last_id=Max('id'))
+        raw = (
+            f"{EXPORT_FORMAT_VERSION}:{stats['total']}:"
+            f"{stats['last_update'] and stats['last_update'].isoformat()}:{stats['last_id']}"
+        )
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
 
-@shared_task(bind=True)
-def import_persons_from_csv(self, file_content):
-    stream = io.StringIO(file_content)
-    reader = csv.DictReader(stream)
-    
-    success_count = 0
+    @staticmethod
+    def current_checkpoint():
+        """
+        Checkpoint da alteração mais recente, ponto de partida para a próxima
+        exportação incremental (None se a tabela estiver vazia).
+        """
+        last = Person.objects.order_by('-updated_at', '-id').values_list('updated_at', 'id').first()
+        last_tombstone = PersonTombstone.objects.aggregate(last_id=Max('id'))['last_id']
+        if last is None and last_tombstone is None:
+            return None
+        updated_at, person_id = last or (EPOCH, 0)
+        return format_checkpoint(updated_at, person_id, last_tombstone or 0)
+
+
+def _chunked(iterable, size):
+    """
+    Agrupa os itens de um iterável em listas de no máximo `size` elementos.
+    """
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _build_person(row):
+    """
+    Valida uma linha do CSV em memória e devolve a instância (sem salvar).
+    A checagem de unicidade fica a cargo da gravação em lote.
+    """
+    # 1. Validação Manual de Negócio (ex: CPF), normalizando para apenas dígitos
+    try:
+        cpf = validate_cpf_numbers((row.get('cpf') or '').strip())
+    except ValidationError as e:
+        raise ValidationError({'cpf': e})
+
+    # 2. Preparação da instância (sem salvar ainda)
+    person = Person(
+        name=row['name'],
+        date_of_birth=row['date_of_birth'],
+        cpf=cpf,
+        sex=row['sex'],
+        height=row['height'],
+        weight=row['weight']
+    )
+
+    # 3. Validação do Model (campos, escolhas e limites), sem consultar o banco.
+    # As métricas de peso são calculadas depois, a partir dos valores já validados
+    # (o bulk_create não passa pelo `save`).
+    person.full_clean(exclude=Person.WEIGHT_METRIC_FIELDS, validate_unique=False)
+    person.update_weight_metrics()
+    return person
+
+
+def _error_kind(exc):
+    """
+    Classifica o erro para o resumo da importação: campos inválidos
+    (ex: `cpf`, `height`), CPF duplicado ou erro inesperado.
+    """
+    if not isinstance(exc, ValidationError):
+        return 'inesperado'
+
+    if hasattr(exc, 'error_dict'):
+        errors = [error for field_errors in exc.error_dict.values() for error in field_errors]
+        kind = '+'.join(sorted(exc.error_dict))
+    else:
+        errors = exc.error_list
+        kind = 'validacao'
+
+    codes = {error.code for error in errors}
+    if 'unique' in codes:
+        return 'cpf_duplicado'
+    if 'duplicate_in_file' in codes:
+        return 'cpf_repetido_arquivo'
+    return kind
+
+
+def _row_error(line, row, exc):
+    """
+    Retorna o erro da linha como `(linha, tipo, mensagem)`.
+    """
+    if isinstance(exc, ValidationError):
+        message = f"Linha {line} ({row.get('name')}): {exc.messages}"
+    else:
+        message = f"Linha {line}: Erro inesperado: {str(exc)}"
+    return line, _error_kind(exc), message
+
+
+def _duplicate_cpf_error(person):
+    return ValidationError(person.unique_error_message(Person, ('cpf',)))
+
+
+def _write_batch(people, mode):
+    """
+    Grava um lote com um único INSERT. Nos modos `upsert` e `skip-existing`
+    o conflito no CPF é resolvido pelo próprio banco (ON CONFLICT).
+    """
+    if mode == IMPORT_MODE_UPSERT:
+        Person.objects.bulk_create(
+            people,
+            update_conflicts=True,
+            unique_fields=['cpf'],
+            update_fields=IMPORT_UPDATE_FIELDS,
+        )
+    elif mode == IMPORT_MODE_SKIP_EXISTING:
+        Person.objects.bulk_create(people, ignore_conflicts=True)
+    else:
+        Person.objects.bulk_create(people)
+
+
+def _validate_chunk(chunk, seen_cpfs):
+    """
+    Valida em memória um bloco de linhas `(numero_da_linha, row)` e descarta
+    CPFs repetidos dentro do próprio arquivo. Retorna (validas, erros).
+    """
     errors = []
+    valid = []
 
-    for index, row in enumerate(reader):
+    for line, row in chunk:
         try:
-            # 1. Validação Manual de Negócio (ex: CPF)
-            cpf = row.get('cpf', '').strip()
-            validate_cpf_numbers(cpf)
-            
-            # 2. Preparação da instância (sem salvar ainda)
-            person = Person(
-                name=row['name'],
-                date_of_birth=row['date_of_birth'],
-                cpf=cpf,
-                sex=row['sex'],
-                height=row['height'],
-                weight=row['weight']
-            )
-            
-            # 3. Validação completa do Model (checa campos, escolhas e constraints)
-            person.full_clean() 
-            person.save()
-            success_count += 1
-            
-        except ValidationError as e:
-            errors.append(f"Linha {index + 1} ({row.get('name')}): {e.messages}")
+            person = _build_person(row)
         except Exception as e:
-            errors.append(f"Linha {index + 1}: Erro inesperado: {str(e)}")
+            errors.append(_row_error(line, row, e))
+            continue
+
+        # CPF repetido dentro do próprio arquivo
+        if person.cpf in seen_cpfs:
+            errors.append(_row_error(line, row, ValidationError(
+                "CPF repetido no arquivo.", code='duplicate_in_file')))
+            continue
+        seen_cpfs.add(person.cpf)
+        valid.append((line, row, person))
+
+    return valid, errors
+
+
+def _import_chunk(chunk, seen_cpfs, mode=IMPORT_MODE_INSERT):
+    """
+    Processa um bloco de linhas `(numero_da_linha, row)`.
+    Valida tudo em memória, separa os CPFs repetidos (no arquivo ou no banco)
+    e grava as linhas restantes com um único bulk_create dentro de uma
+    transação. Retorna (contadores, erros), com os erros como `(linha, tipo, mensagem)`.
+    """
+    counts = {"created": 0, "updated": 0, "skipped": 0}
+    valid, errors = _validate_chunk(chunk, seen_cpfs)
+
+    # CPFs já cadastrados: uma única consulta `IN` por bloco
+    existing = set(
+        Person.objects.filter(cpf__in=[person.cpf for _, _, person in valid])
+        .values_list('cpf', flat=True)
+    ) if valid else set()
+
+    pending = []
+    for line, row, person in valid:
+        if person.cpf not in existing:
+            pending.append((line, row, person))
+        elif mode == IMPORT_MODE_UPSERT:
+            pending.append((line, row, person))
+        elif mode == IMPORT_MODE_SKIP_EXISTING:
+            counts["skipped"] += 1
+        else:
+            errors.append(_row_error(line, row, _duplicate_cpf_error(person)))
+
+    if pending:
+        try:
+            with transaction.atomic():
+                _write_batch([person for _, _, person in pending], mode)
+            for _, _, person in pending:
+                counts["updated" if person.cpf in existing else "created"] += 1
+        except IntegrityError:
+            # Outro processo gravou um dos CPFs entre a consulta e o INSERT.
+            # Refaz o bloco linha a linha, com savepoints, para apontar o erro exato.
+            for line, row, person in pending:
+                try:
+                    with transaction.atomic():
+                        if mode == IMPORT_MODE_INSERT:
+                            person.validate_unique()
+                            person.save()
+                        else:
+                            _write_batch([person], mode)
+                    counts["updated" if person.cpf in existing else "created"] += 1
+                except Exception as e:
+                    errors.append(_row_error(line, row, e))
+
+    return counts, sorted(errors)
+
+
+def _import_chunk_copy(chunk, seen_cpfs, mode=IMPORT_MODE_INSERT):
+    """
+    Variante de `_import_chunk` para o engine `copy` (PostgreSQL).
+    As linhas validadas em memória são carregadas com COPY ... FROM STDIN em
+    uma tabela temporária e gravadas em `persons_person` com um único
+    INSERT ... SELECT ... ON CONFLICT (cpf). O RETURNING indica quais CPFs
+    foram inseridos ou atualizados; os demais já existiam no banco.
+    """
+    counts = {"created": 0, "updated": 0, "skipped": 0}
+    valid, errors = _validate_chunk(chunk, seen_cpfs)
+    if not valid:
+        return counts, sorted(errors)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for line, _, person in valid:
+        writer.writerow([line, *(getattr(person, field) for field in COPY_IMPORT_FIELDS)])
+    buffer.seek(0)
+
+    table = connection.ops.quote_name(Person._meta.db_table)
+    columns = ', '.join(COPY_IMPORT_FIELDS)
+    if mode == IMPORT_MODE_UPSERT:
+        assignments = ', '.join(f"{field} = EXCLUDED.{field}" for field in IMPORT_UPDATE_FIELDS)
+        on_conflict = f"DO UPDATE SET {assignments}"
+    else:
+        on_conflict = "DO NOTHING"
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {COPY_STAGING_TABLE}")
+        cursor.execute(
+            f"CREATE TEMP TABLE {COPY_STAGING_TABLE} (line integer, name varchar(150), "
+            f"date_of_birth date, cpf varchar(14), sex varchar(1), "
+            f"height numeric(3, 2), weight numeric(5, 2), ideal_weight numeric(5, 2), "
+            f"bmi numeric(6, 2), weight_gap numeric(5, 2)) ON COMMIT DROP"
+        )
+        cursor.copy_expert(
+            f"COPY {COPY_STAGING_TABLE} (line, {columns}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+        # clock_timestamp() é avaliado linha a linha (now() seria o mesmo para o
+        # bloco inteiro), como os timestamps gravados pelo engine ORM
+        cursor.execute(
+            f"INSERT INTO {table} ({columns}, created_at, updated_at) "
+            f"SELECT {columns}, written_at, written_at FROM ("
+            f"SELECT {columns}, clock_timestamp() AS written_at FROM {COPY_STAGING_TABLE} ORDER BY line"
+            f") AS staged "
+            f"ON CONFLICT (cpf) {on_conflict} "
+            f"RETURNING cpf, (xmax = 0)"
+        )
+        written = dict(cursor.fetchall())
+
+    for line, row, person in valid:
+        if person.cpf in written:
+            counts["created" if written[person.cpf] else "updated"] += 1
+        elif mode == IMPORT_MODE_SKIP_EXISTING:
+            counts["skipped"] += 1
+        else:
+            errors.append(_row_error(line, row, _duplicate_cpf_error(person)))
+
+    return counts, sorted(errors)
+
 
+def _import_file(file_path, chunk_size, mode, report_name, first_line=1,
+                 progress=None, engine=ENGINE_ORM, seen_cpfs=()):
+    """
+    Importa o CSV salvo em `file_path` (no default_storage), numerando as
+    linhas a partir de `first_line`. O arquivo é lido de forma incremental,
+    bloco a bloco, e removido ao final. Os erros vão para um relatório salvo
+    em `report_name`. `seen_cpfs` são os CPFs que já apareceram antes deste
+    trecho do arquivo (em shards anteriores). Retorna os contadores e o resumo dos erros.
+    """
+    import_chunk = _import_chunk_copy if engine == ENGINE_COPY else _import_chunk
+    totals = {"created": 0, "updated": 0, "skipped": 0}
+    report = ImportErrorReport()
+    seen_cpfs = set(seen_cpfs)
+
+    try:
+        with default_storage.open(file_path, 'rb') as raw:
+            stream = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+            reader = csv.DictReader(stream)
+
+            rows = enumerate(reader, start=first_line)
+            for chunk in _chunked(rows, chunk_size):
+                counts, chunk_errors = import_chunk(chunk, seen_cpfs, mode)
+                for key, value in counts.items():
+                    totals[key] += value
+                for error in chunk_errors:
+                    report.add(*error)
+                if counts["created"] or counts["updated"]:
+                    bump_person_list_version()
+                if counts["updated"]:
+                    bump_person_epoch()
+                if progress:
+                    progress.advance(len(chunk), len(chunk_errors))
+    finally:
+        default_storage.delete(file_path)
+
+    return {**totals, **report.as_dict(report.save(report_name))}
+
+
+def _save_shard(file_path, index, shard):
+    base, ext = os.path.splitext(file_path)
+    shard.seek(0)
+    path = default_storage.save(f"{base}.part{index}{ext}", File(shard))
+    shard.close()
+    return path
+
+
+def _split_into_shards(file_path, shard_size):
+    """
+    Divide o CSV em arquivos de até `shard_size` linhas, cada um com o
+    cabeçalho original. Retorna a lista `(caminho, primeira_linha, cpfs_anteriores)`,
+    onde `primeira_linha` mantém a numeração do arquivo original e
+    `cpfs_anteriores` são os CPFs do shard que já apareceram em um shard
+    anterior (cada shard só enxerga as próprias linhas), e o total de linhas.
+    Se o arquivo couber em um único shard, devolve o próprio arquivo, sem cópias.
+    """
+    shards = []
+    current = None
+    first_line = 1
+    total = 0
+    # CPF (só dígitos, como em `_build_person`) -> índice do primeiro shard em que aparece
+    first_shard = {}
+    repeated = set()
+
+    with default_storage.open(file_path, 'rb') as raw:
+        reader = csv.reader(io.TextIOWrapper(raw, encoding='utf-8', newline=''))
+        header = next(reader, None)
+        cpf_column = header.index('cpf') if header and 'cpf' in header else None
+
+        # Linhas em branco são ignoradas pelo DictReader e não entram na numeração
+        rows = enumerate((row for row in reader if row), start=1)
+        for line, row in rows:
+            if current is None:
+                current = tempfile.TemporaryFile('w+', encoding='utf-8', newline='')
+                writer = csv.writer(current)
+                writer.writerow(header)
+                first_line, count = line, 0
+
+            writer.writerow(row)
+            count += 1
+            total = line
+            if cpf_column is not None and cpf_column < len(row):
+                cpf = re.sub(r'[^0-9]', '', row[cpf_column])
+                if cpf and first_shard.setdefault(cpf, len(shards)) < len(shards):
+                    repeated.add(cpf)
+            if count >= shard_size:
+                shards.append((_save_shard(file_path, len(shards), current), first_line, sorted(repeated)))
+                current, repeated = None, set()
+
+    if not shards:
+        if current is not None:
+            current.close()
+        return [(file_path, 1, [])], total
+
+    if current is not None:
+        shards.append((_save_shard(file_path, len(shards), current), first_line, sorted(repeated)))
+
+    default_storage.delete(file_path)
+    return shards, total
+
+
+def _import_result(mode, totals):
     return {
         "status": "completed",
-        "created": success_count,
-        "errors": errors
+        "mode": mode,
+        "created": totals["created"],
+        "updated": totals["updated"],
+        "skipped": totals["skipped"],
+        "errors": totals["errors"],
+        "error_count": totals["error_count"],
+        "error_types": totals["error_types"],
+        "error_file": totals["error_file"]
     }
 
-@shared_task
-def export_persons_to_csv():
-    # 1. Busca os dados
-    people = Person.objects.all()
-    
-    # 2. Cria o arquivo CSV em memória
-    output = io.StringIO()
+
+def _import_chunk_size(engine):
+    if engine == ENGINE_COPY:
+        return settings.IMPORT_COPY_CHUNK_SIZE
+    return settings.IMPORT_CHUNK_SIZE
+
+
+def _error_report_name(task_id):
+    return f"reports/import-errors-{task_id or uuid.uuid4().hex}.csv"
+
+
+@shared_task(bind=True)
+def import_persons_shard(self, file_path, first_line, chunk_size=None,
+                         mode=IMPORT_MODE_INSERT, progress_id=None, engine=None, seen_cpfs=()):
+    """
+    Importa um shard (faixa de linhas) gerado por `import_persons_from_csv`.
+    O andamento é somado ao da task original (`progress_id`), e os CPFs de
+    `seen_cpfs` (já vistos em shards anteriores) são tratados como repetidos no arquivo.
+    """
+    engine = engine or settings.IMPORT_ENGINE
+    chunk_size = chunk_size or _import_chunk_size(engine)
+    progress = TaskProgress(self, progress_id)
+    report_name = _error_report_name(self.request.id)
+    return _import_file(
+        file_path, chunk_size, mode, report_name, first_line, progress, engine, seen_cpfs)
+
+
+@shared_task(bind=True)
+def merge_import_results(self, results, mode=IMPORT_MODE_INSERT):
+    """
+    Callback do chord: soma os resultados dos shards em um único resumo e
+    junta os relatórios de erro. Os shards chegam na ordem do arquivo,
+    então os erros continuam ordenados.
+    """
+    totals = {"created": 0, "updated": 0, "skipped": 0}
+    report = ImportErrorReport()
+    for result in results:
+        for key in totals:
+            totals[key] += result[key]
+        report.merge(result)
+
+    error_file = report.save(_error_report_name(self.request.id))
+    return _import_result(mode, {**totals, **report.as_dict(error_file)})
+
+
+@shared_task(bind=True)
+def import_persons_from_csv(self, file_path, chunk_size=None, mode=IMPORT_MODE_INSERT, engine=None):
+    """
+    Importa o CSV salvo em `file_path` (no default_storage).
+    Arquivos maiores que IMPORT_SHARD_SIZE linhas são divididos em shards,
+    processados em paralelo pelos workers (chord). O callback do chord herda
+    o ID desta task, então o acompanhamento pelo `import_status` não muda.
+    `engine` escolhe a gravação: `orm` (bulk_create) ou `copy` (COPY do PostgreSQL).
+    """
+    engine = engine or settings.IMPORT_ENGINE
+    chunk_size = chunk_size or _import_chunk_size(engine)
+    shards, total = _split_into_shards(file_path, settings.IMPORT_SHARD_SIZE)
+
+    progress = TaskProgress(self, self.request.id)
+    progress.start(total)
+
+    if len(shards) == 1:
+        shard_path, first_line, _ = shards[0]
+        report_name = _error_report_name(self.request.id)
+        return _import_result(mode, _import_file(
+            shard_path, chunk_size, mode, report_name, first_line, progress, engine))
+
+    header = group(
+        import_persons_shard.s(shard_path, first_line, chunk_size, mode, self.request.id, engine, seen_cpfs)
+        for shard_path, first_line, seen_cpfs in shards
+    )
+    return self.replace(chord(header, merge_import_results.s(mode=mode)))
+
+
+def _export_rows(writer, progress):
+    """
+    Escreve as pessoas no `writer` a partir de um cursor no servidor, em lotes
+    de EXPORT_CHUNK_SIZE tuplas com apenas as colunas necessárias, sem
+    instanciar o Model.
+    """
+    people = Person.objects.order_by('id').values_list(*EXPORT_FIELDS)
+    rows = people.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+    writer.write_header()
+    for batch in _chunked(rows, settings.EXPORT_CHUNK_SIZE):
+        writer.write_batch(batch)
+        progress.advance(len(batch))
+
+
+def _export_rows_copy(writer):
+    """
+    Variante de `_export_rows` para o engine `copy` (PostgreSQL), nos formatos
+    CSV: o próprio banco gera o CSV com COPY (SELECT ...) TO STDOUT.
+    """
+    table = connection.ops.quote_name(Person._meta.db_table)
+    sex_display = " ".join(
+        f"WHEN '{value}' THEN '{label}'" for value, label in Person.SEX_CHOICES)
+    header = [connection.ops.quote_name(column) for column in EXPORT_HEADER]
+    query = (
+        f"SELECT name AS {header[0]}, date_of_birth AS {header[1]}, cpf AS {header[2]}, "
+        f"CASE sex {sex_display} ELSE sex END AS {header[3]}, "
+        f"height AS {header[4]}, weight AS {header[5]}, "
+        f"ideal_weight AS {header[6]} "
+        f"FROM {table} ORDER BY id"
+    )
+    with connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", writer.stream)
+
+
+def export_file_name(fingerprint, export_format=EXPORT_FORMAT_CSV):
+    return f"{EXPORT_DIR}/pessoas-{fingerprint}.{EXPORT_FORMATS[export_format].extension}"
+
+
+def export_lock_key(fingerprint, export_format=EXPORT_FORMAT_CSV):
+    return f"export-running:{fingerprint}:{export_format}"
+
+
+def export_done_key(fingerprint, export_format=EXPORT_FORMAT_CSV):
+    return f"export-done:{fingerprint}:{export_format}"
+
+
+def finished_export(fingerprint, export_format=EXPORT_FORMAT_CSV):
+    """
+    Caminho da exportação concluída com este fingerprint, ou None.
+    A chave só é gravada depois que o arquivo foi salvo por completo: a mera
+    existência do arquivo no storage não basta, ele pode estar sendo escrito.
+    """
+    path = cache.get(export_done_key(fingerprint, export_format))
+    if path and default_storage.exists(path):
+        return path
+    return None
+
+
+def _cleanup_exports(keep):
+    """
+    Remove os arquivos exportados há mais de EXPORT_RETENTION_HOURS, exceto `keep`.
+    """
+    if not default_storage.exists(EXPORT_DIR):
+        return
+    limit = timezone.now() - timedelta(hours=settings.EXPORT_RETENTION_HOURS)
+    for name in default_storage.listdir(EXPORT_DIR)[1]:
+        path = f"{EXPORT_DIR}/{name}"
+        if path != keep and default_storage.get_modified_time(path) < limit:
+            default_storage.delete(path)
+
+
+@shared_task(bind=True)
+def export_persons_to_csv(self, engine=None, fingerprint=None, export_format=EXPORT_FORMAT_CSV):
+    """
+    Exporta todas as pessoas em memória constante: as linhas são escritas,
+    lote a lote, direto em um arquivo temporário, copiado em streaming para
+    o storage. `export_format` escolhe o formato (csv, csv.gz, jsonl, parquet)
+    e `engine` a leitura: `orm` (cursor no servidor) ou `copy` (COPY do
+    PostgreSQL, apenas nos formatos CSV). O arquivo é nomeado pelo
+    fingerprint da tabela; se a exportação desse fingerprint já foi concluída,
+    o arquivo é devolvido sem uma nova leitura.
+    """
+    engine = engine or settings.EXPORT_ENGINE
+    fingerprint = fingerprint or PersonTask.export_fingerprint()
+    filename = export_file_name(fingerprint, export_format)
+
+    try:
+        finished = finished_export(fingerprint, export_format)
+        if finished:
+            return {"file_url": finished, "next_checkpoint": PersonTask.current_checkpoint()}
+
+        progress = TaskProgress(self, self.request.id)
+        total = Person.objects.count()
+        checkpoint = PersonTask.current_checkpoint()
+        progress.start(total)
+
+        with tempfile.TemporaryFile() as output:
+            # 1. Escreve o arquivo lote a lote
+            writer = EXPORT_FORMATS[export_format](output)
+            if engine == ENGINE_COPY and isinstance(writer, CsvExportWriter):
+                _export_rows_copy(writer)
+                progress.advance(total)
+            else:
+                _export_rows(writer, progress)
+            writer.close()
+
+            # 2. Salva o arquivo no storage (ex: media/exports/)
+            output.seek(0)
+            path = default_storage.save(filename, File(output))
+
+        # 3. Só agora a exportação passa a ser reaproveitada
+        cache.set(export_done_key(fingerprint, export_format), path, settings.EXPORT_RETENTION_HOURS * 60 * 60)
+    finally:
+        cache.delete(export_lock_key(fingerprint, export_format))
+
+    _cleanup_exports(keep=path)
+    return {"file_url": path, "next_checkpoint": checkpoint}
+
+
+def format_checkpoint(updated_at, person_id, tombstone_id):
+    return f"{updated_at.isoformat()}_{person_id}_{tombstone_id}"
+
+
+def parse_checkpoint(value):
+    """
+    Converte o checkpoint `<updated_at ISO 8601>_<id>_<id do tombstone>` em
+    `(datetime, id, id do tombstone)`. No formato antigo, sem o último campo,
+    o id do tombstone é None (exclusões a partir de `updated_at`).
+    """
+    try:
+        timestamp, *ids = value.rsplit('_', 2)
+        updated_at = datetime.fromisoformat(timestamp)
+        person_id = int(ids[0])
+        tombstone_id = int(ids[1]) if len(ids) == 2 else None
+    except (AttributeError, IndexError, ValueError):
+        raise ValueError("Checkpoint inválido. Use o valor `next_checkpoint` da última exportação.")
+    if timezone.is_naive(updated_at):
+        updated_at = timezone.make_aware(updated_at)
+    return updated_at, person_id, tombstone_id
+
+
+def _export_delta_rows(output, since, progress):
+    """
+    Escreve no CSV `output` as pessoas alteradas depois do checkpoint `since`,
+    pelo índice `person_updated_at_id_idx`, e as exclusões (tombstones) com id
+    maior que o do checkpoint, intercaladas em ordem de tempo: um CPF excluído
+    e recriado no mesmo delta termina com o `U` do registro novo, não com o `D`.
+    Retorna o próximo checkpoint.
+    """
+    updated_at, person_id, tombstone_id = since
+    people = (
+        Person.objects
+        .filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=person_id))
+        .order_by('updated_at', 'id')
+        .values_list(*EXPORT_FIELDS, 'updated_at')
+    )
+    tombstones = PersonTombstone.objects.order_by('deleted_at', 'id')
+    if tombstone_id is None:
+        tombstones = tombstones.filter(deleted_at__gte=updated_at)
+    else:
+        tombstones = tombstones.filter(id__gt=tombstone_id)
+    sex_display = dict(Person.SEX_CHOICES)
+    last_person = (updated_at, person_id)
+    last_tombstone = tombstone_id or 0
+
     writer = csv.writer(output)
-    writer.writerow(['Nome', 'Data de Nascimento', 'CPF', 'Sexo', 'Altura', 'Peso', 'Peso Ideal'])
-    
-    for person in people:
-        writer.writerow([
-            person.name,
-            person.date_of_birth,
-            person.cpf,
-            person.get_sex_display(),
-            person.height,
-            person.weight,
-            person.ideal_weight  # Usando a property do Model
-        ])
-    
-    # 3. Salva o arquivo em um local temporário (ex: media/exports/)
-    filename = f"exports/pessoas_exportadas.csv"
-    file_content = ContentFile(output.getvalue().encode('utf-8'))
-    path = default_storage.save(filename, file_content)
-    
-    return {"file_url": path}
\ No newline at end of file
+    writer.writerow(DELTA_HEADER)
+
+    # (instante, ordem no empate, linha): numa mesma marca de tempo, a alteração vem antes da exclusão
+    changes = (
+        (changed_at, 0, (pk, name, date_of_birth, cpf, sex, height, weight, ideal))
+        for pk, name, date_of_birth, cpf, sex, height, weight, ideal, _, _, changed_at
+        in people.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    )
+    deletions = (
+        (deleted_at, 1, (tombstone_pk, pk, cpf))
+        for tombstone_pk, pk, cpf, deleted_at
+        in tombstones.values_list('id', 'person_id', 'cpf', 'deleted_at').iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    )
+
+    written = 0
+    for timestamp, kind, row in heapq.merge(changes, deletions, key=lambda change: change[:2]):
+        if kind == 0:
+            pk, name, date_of_birth, cpf, sex, height, weight, ideal = row
+            written += 1
+            if written % EXPORT_PROGRESS_STEP == 0:
+                progress.advance(EXPORT_PROGRESS_STEP)
+            writer.writerow([
+                DELTA_UPSERT,
+                pk,
+                name,
+                date_of_birth,
+                cpf,
+                sex_display.get(sex, sex),
+                height,
+                weight,
+                ideal,
+                timestamp.isoformat()
+            ])
+            last_person = (timestamp, pk)
+        else:
+            tombstone_pk, pk, cpf = row
+            writer.writerow([DELTA_DELETE, pk, '', '', cpf, '', '', '', '', timestamp.isoformat()])
+            last_tombstone = max(last_tombstone, tombstone_pk)
+
+    return format_checkpoint(*last_person, last_tombstone)
+
+
+@shared_task(bind=True)
+def export_persons_delta_to_csv(self, since):
+    """
+    Exportação incremental: apenas as pessoas alteradas ou excluídas depois
+    do checkpoint `since`. Retorna o arquivo e o próximo checkpoint.
+    """
+    since = parse_checkpoint(since)
+    progress = TaskProgress(self, self.request.id)
+    progress.start()
+
+    with tempfile.TemporaryFile('w+', encoding='utf-8', newline='') as output:
+        next_checkpoint = _export_delta_rows(output, since, progress)
+        output.seek(0)
+        path = default_storage.save(
+            f"{EXPORT_DIR}/pessoas-delta-{uuid.uuid4().hex}.csv", File(output))
+
+    # Tombstones antigos já foram consumidos por qualquer exportação regular
+    PersonTombstone.objects.filter(
+        deleted_at__lt=timezone.now() - timedelta(days=settings.TOMBSTONE_RETENTION_DAYS)
+    ).delete()
+    _cleanup_exports(keep=path)
+
+    return {"file_url": path, "next_checkpoint": next_checkpoint}
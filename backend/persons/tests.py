@@ -1,10 +1,44 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
 import re
+import tempfile
+import threading
+import uuid
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import Value
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APITestCase
 from faker import Faker
+import brotli
+import msgpack
+import pyarrow.parquet as pq
 
-from .models import Person
+from .caching import aget_cached_person, get_cached_person, person_cache_key, person_list_version
+from .formulas import FORMULAS
+from .models import PERSON_FIELDS, Person, PersonTombstone
+from .renderers import ORJSONRenderer
+from .serializers import PersonReadSerializer, PersonSerializer
+from .progress import TaskProgress
+from .tasks import (
+    PersonTask, export_file_name, export_lock_key, export_persons_delta_to_csv, export_persons_to_csv,
+    import_persons_from_csv, parse_checkpoint
+)
+from .views import PersonViewSet
 
 class PersonAPITests(APITestCase):
     def setUp(self):
@@ -18,7 +52,9 @@ class PersonAPITests(APITestCase):
             "height": 1.80,
             "weight": 85.00
         }
-        self.person = Person.objects.create(**self.person_data)
+        # O cache é invalidado no commit, que o TestCase não faz
+        with self.captureOnCommitCallbacks(execute=True):
+            self.person = Person.objects.create(**self.person_data)
         self.url = reverse('person-list')
 
     def test_create_person(self):
@@ -41,15 +77,15 @@ class PersonAPITests(APITestCase):
         """Testa se a listagem de pessoas funciona"""
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
 
     def test_search_by_cpf(self):
         """Testa a funcionalidade de busca (Requisito: Pesquisar) """
         url = f"{self.url}?cpf={self.base_cpf}" 
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['cpf'], self.base_cpf)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['cpf'], self.base_cpf)
 
     def test_update_person(self):
         """Testa a alteração do peso (Requisito: Alterar) """
@@ -153,8 +189,8 @@ class PersonAPITests(APITestCase):
         response = self.client.get(self.url, {'search': 'Wonder'}, format='json')
         
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['name'], "Alice Wonder")
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['name'], "Alice Wonder")
 
     def test_search_by_cpf_exact(self):
         """Testa se a pesquisa encontra uma pessoa pelo CPF exato"""
@@ -171,12 +207,1062 @@ class PersonAPITests(APITestCase):
         response = self.client.get(self.url, {'search': target_cpf}, format='json')
         
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['cpf'], target_cpf)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['cpf'], target_cpf)
 
     def test_search_no_results(self):
         """Testa se retorna lista vazia quando nenhum critério é satisfeito"""
         response = self.client.get(self.url, {'search': 'Inexistente'}, format='json')
         
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 0)
+        self.assertEqual(len(response.data['results']), 0)
+
+
+    def test_list_cursor_pagination(self):
+        """A listagem é paginada por cursor, sem repetir nem pular registros entre as páginas"""
+        for _ in range(4):
+            Person.objects.create(**{**self.person_data, "cpf": self.fake.cpf()})
+
+        response = self.client.get(self.url, {'page_size': 2, 'search': 'John'})
+        first_page = response.data
+        self.assertEqual(len(first_page['results']), 2)
+        self.assertIsNone(first_page['previous'])
+
+        ids = [person['id'] for person in first_page['results']]
+        next_url = first_page['next']
+        while next_url:
+            page = self.client.get(next_url).data
+            ids.extend(person['id'] for person in page['results'])
+            next_url = page['next']
+
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(ids, sorted(set(ids), reverse=True))
+
+    def _create_tied_people(self, count, **fields):
+        """Cria `count` pessoas com o mesmo created_at (como numa carga em lote)"""
+        people = [Person(**{**self.person_data, "cpf": f"{index:011d}", **fields}) for index in range(count)]
+        for person in people:
+            person.update_weight_metrics()
+        Person.objects.bulk_create(people)
+        Person.objects.update(created_at=timezone.now())
+
+    def _walk_pages(self, params):
+        response = self.client.get(self.url, params)
+        ids = [person['id'] for person in response.data['results']]
+        pages = 1
+        while response.data['next']:
+            self.assertLess(pages, 50)
+            response = self.client.get(response.data['next'])
+            ids.extend(person['id'] for person in response.data['results'])
+            pages += 1
+        return ids, response
+
+    def test_list_cursor_pagination_with_tied_created_at(self):
+        """Mais de 1000 registros com o mesmo created_at: o keyset (created_at, id) percorre todos uma vez"""
+        self._create_tied_people(1300)
+        ids, last_page = self._walk_pages({'page_size': 100})
+
+        self.assertEqual(len(ids), 1301)
+        self.assertEqual(ids, sorted(set(ids), reverse=True))
+
+        # O `previous` volta exatamente para a página anterior
+        previous = self.client.get(last_page.data['previous']).data
+        self.assertEqual([person['id'] for person in previous['results']], ids[-101:-1])
+
+    def test_metric_and_ranked_pagination_with_ties(self):
+        """Ordenação por métrica e por relevância com empates: o keyset (valor, id) não repete nem pula"""
+        self._create_tied_people(1300)
+
+        ids, _ = self._walk_pages({'page_size': 100, 'ordering': 'ideal_weight'})
+        self.assertEqual(len(ids), 1301)
+        self.assertEqual(ids, sorted(set(ids)))
+
+        ids, _ = self._walk_pages({'page_size': 100, 'ordering': '-bmi'})
+        self.assertEqual(ids, sorted(set(ids), reverse=True))
+        self.assertEqual(len(ids), 1301)
+
+        ids, _ = self._walk_pages({'page_size': 100, 'search': 'John Doe', 'rank': 'true'})
+        self.assertEqual(len(ids), 1301)
+        self.assertEqual(ids, sorted(set(ids), reverse=True))
+
+    def test_name_search_uses_trigram_index(self):
+        """A busca por parte do nome (icontains) é atendida pelo índice GIN de trigramas"""
+        with connection.cursor() as cursor:
+            # A tabela de teste é pequena: sem isso o planner sempre prefere o seq scan
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        plan = PersonTask.filter_people({}, search_term="ohn Do").explain()
+        self.assertIn('person_name_upper_trgm_idx', plan)
+
+    def test_ranked_pagination_with_fractional_similarity(self):
+        """Empates numa similaridade fracionária (não representável exatamente) também avançam de página"""
+        self._create_tied_people(35, name="Maria Aparecida da Silva")
+        ids, _ = self._walk_pages({'page_size': 10, 'search': 'aparecida', 'rank': 'true'})
+
+        self.assertEqual(len(ids), 35)
+        self.assertEqual(ids, sorted(set(ids), reverse=True))
+
+    def test_search_by_formatted_cpf(self):
+        """A busca normaliza o CPF formatado para dígitos antes da comparação exata"""
+        formatted_cpf = self.fake.cpf()
+        Person.objects.create(**{**self.person_data, "name": "Formatado", "cpf": re.sub(r'[^0-9]', '', formatted_cpf)})
+
+        response = self.client.get(self.url, {'search': formatted_cpf})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([person['name'] for person in response.data['results']], ["Formatado"])
+
+    def test_search_ranked_by_similarity(self):
+        """Com rank=true, os nomes mais parecidos com o termo vêm primeiro"""
+        Person.objects.create(**{**self.person_data, "name": "Maria Silva Santos Oliveira", "cpf": self.fake.cpf()})
+        Person.objects.create(**{**self.person_data, "name": "Maria Silva", "cpf": self.fake.cpf()})
+
+        response = self.client.get(self.url, {'search': 'Maria Silva', 'rank': 'true', 'page_size': 1})
+        second_page = self.client.get(response.data['next'])
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [person['name'] for person in response.data['results'] + second_page.data['results']],
+            ["Maria Silva", "Maria Silva Santos Oliveira"]
+        )
+        self.assertIsNone(second_page.data['next'])
+
+    def test_list_cache_invalidated_on_write(self):
+        """A listagem em cache reflete na hora criações, edições e exclusões"""
+        self.assertEqual(len(self.client.get(self.url).data['results']), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            created = self.client.post(self.url, {**self.person_data, "name": "Jane Doe", "cpf": self.fake.cpf()}, format='json')
+        names = [person['name'] for person in self.client.get(self.url).data['results']]
+        self.assertEqual(names, ["Jane Doe", "John Doe"])
+
+        detail_url = reverse('person-detail', kwargs={'id': created.data['id']})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(detail_url, {**created.data, "name": "Jane Smith"}, format='json')
+        names = [person['name'] for person in self.client.get(self.url).data['results']]
+        self.assertEqual(names, ["Jane Smith", "John Doe"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(detail_url)
+        names = [person['name'] for person in self.client.get(self.url).data['results']]
+        self.assertEqual(names, ["John Doe"])
+
+    def test_signal_invalidates_cache_after_commit(self):
+        """Gravações pelo `save` só invalidam o cache depois do commit da transação"""
+        version = person_list_version()
+        with self.captureOnCommitCallbacks() as callbacks:
+            Person.objects.create(**{**self.person_data, "cpf": self.fake.cpf()})
+            self.assertEqual(person_list_version(), version)
+
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(person_list_version(), version)
+
+    def test_list_cache_is_shared_between_sessions(self):
+        """A mesma página é servida do cache para clientes diferentes"""
+        self.client.get(self.url)
+        self.client.cookies['sessionid'] = 'outra-sessao'
+
+        with mock.patch('persons.views.PersonService.handle_search') as handle_search:
+            response = self.client.get(self.url)
+        handle_search.assert_not_called()
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_weight_metrics_recalculated_on_save(self):
+        """Peso ideal, IMC e diferença acompanham as alterações de altura e peso"""
+        self.assertEqual(self.person.ideal_weight, Decimal("72.86"))
+        self.person.height = Decimal("1.70")
+        self.person.weight = Decimal("90.00")
+        self.person.save(update_fields=['height', 'weight'])
+
+        self.person.refresh_from_db()
+        self.assertEqual(
+            (self.person.ideal_weight, self.person.bmi, self.person.weight_gap),
+            (Decimal("65.59"), Decimal("31.14"), Decimal("24.41"))
+        )
+
+    def test_list_filters_and_orders_by_weight_gap(self):
+        """Filtro e ordenação pela diferença de peso acontecem no banco"""
+        Person.objects.create(**{**self.person_data, "name": "Acima 30", "cpf": self.fake.cpf(), "weight": 103.00})
+        Person.objects.create(**{**self.person_data, "name": "Acima 25", "cpf": self.fake.cpf(), "weight": 98.00})
+
+        response = self.client.get(self.url, {'min_weight_gap': 20, 'ordering': '-weight_gap'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([person['name'] for person in response.data['results']], ["Acima 30", "Acima 25"])
+        self.assertEqual(response.data['results'][0]['weight_gap'], 30.14)
+
+    def test_list_rejects_invalid_metric_parameters(self):
+        """Ordenação fora da lista permitida ou filtro não numérico retornam 400"""
+        self.assertEqual(self.client.get(self.url, {'ordering': 'cpf'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(self.url, {'min_bmi': 'abc'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_ideal_weight_batch_by_ids(self):
+        """O lote por ids usa uma única consulta e responde em colunas, na ordem pedida"""
+        other = Person.objects.create(**{**self.person_data, "cpf": self.fake.cpf(), "sex": "F", "height": 1.60})
+        url = reverse('person-calculate-ideal-weight-batch')
+
+        with self.assertNumQueries(1):
+            response = self.client.post(url, {"ids": [other.id, 999999, self.person.id]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {
+            "id": [other.id, self.person.id],
+            "ideal_weight": [54.66, 72.86],
+            "missing": [999999],
+        })
+
+    def test_ideal_weight_batch_by_pairs(self):
+        """Pares (sexo, altura) avulsos são calculados sem consultar o banco"""
+        url = reverse('person-calculate-ideal-weight-batch')
+        payload = {"sex": ["M", "F", "M"], "height": ["1.80", "1.60", "1.80"]}
+
+        with self.assertNumQueries(0):
+            response = self.client.post(url, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {"ideal_weight": [72.86, 54.66, 72.86]})
+
+    def test_ideal_weight_batch_validation(self):
+        """Exige ids ou pares completos, com alturas dentro dos limites do cadastro"""
+        url = reverse('person-calculate-ideal-weight-batch')
+        for payload in ({}, {"ids": [1], "sex": ["M"], "height": ["1.80"]},
+                        {"sex": ["M", "F"], "height": ["1.80"]}, {"sex": ["M"], "height": ["3.00"]}):
+            response = self.client.post(url, payload, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, payload)
+
+    def test_ideal_weight_formula_selection(self):
+        """A fórmula pode ser escolhida no detalhe, no cálculo avulso e no lote"""
+        detail_url = reverse('person-detail', kwargs={'id': self.person.id})
+        ideal_url = reverse('person-calculate-ideal-weight', kwargs={'id': self.person.id})
+        batch_url = reverse('person-calculate-ideal-weight-batch')
+
+        # Devine, homem de 1,80 m: 50 + 2,3 * (70,87" - 60) = 74,99
+        self.assertEqual(self.client.get(ideal_url, {'formula': 'devine'}).data['ideal_weight'], 74.99)
+        detail = self.client.get(detail_url, {'formula': 'devine'}).data
+        self.assertEqual((detail['ideal_weight'], detail['weight_gap']), (74.99, 10.01))
+        batch = self.client.post(batch_url, {"ids": [self.person.id], "formula": "hamwi"}, format='json')
+        self.assertEqual(batch.data['ideal_weight'], [77.34])
+        self.assertEqual(self.client.get(ideal_url, {'formula': 'xpto'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_formula_tables_cover_every_valid_height(self):
+        """As tabelas pré-calculadas têm as 201 alturas por sexo e batem com o cálculo direto"""
+        for formula in FORMULAS.values():
+            self.assertEqual(len(formula.table), 2 * 201)
+            for (sex, height), value in formula.table.items():
+                self.assertEqual(value, formula.compute(sex, height))
+        self.assertEqual(Person.calculate_ideal_weight('F', Decimal('1.555')), Decimal('51.87'))
+
+    def test_default_formula_rounds_half_up_like_postgres(self):
+        """Peso ideal arredondado como o ROUND do PostgreSQL (meio para cima), não como o round() de float"""
+        formula = FORMULAS['default']
+        # Com round() de float estes davam 61.95 e 63.97
+        self.assertEqual(formula.ideal_weight('M', Decimal('1.65')), Decimal('61.96'))
+        self.assertEqual(formula.ideal_weight('F', Decimal('1.75')), Decimal('63.98'))
+
+        # E batem com as expressões SQL que recalculam a coluna gravada, em todas as alturas
+        people = Person.objects.filter(pk=self.person.pk)
+        for (sex, height), value in formula.table.items():
+            expression = Person.weight_metric_expressions(Value(sex), Value(height), Value(Decimal('80.00')))
+            with self.subTest(sex=sex, height=height):
+                self.assertEqual(people.values_list(expression['ideal_weight'], flat=True).get(), value)
+
+    def test_bulk_create(self):
+        """Inclusão em lote: um INSERT só, com status por item"""
+        url = reverse('person-bulk-create')
+        items = [{**self.person_data, "name": f"Lote {index}", "cpf": self.fake.cpf()} for index in range(3)]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, items, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([item["status"] for item in response.data["results"]], [201, 201, 201])
+        self.assertEqual(response.data["results"][2]["data"]["name"], "Lote 2")
+        self.assertEqual(Person.objects.get(pk=response.data["results"][0]["id"]).ideal_weight, Decimal("72.86"))
+        self.assertEqual(len(self.client.get(self.url).data['results']), 4)
+
+    def test_bulk_create_is_all_or_nothing(self):
+        """Um item inválido (ou CPF repetido) invalida o lote inteiro, com o erro no item"""
+        url = reverse('person-bulk-create')
+        cpf = self.fake.cpf()
+        existing = Person.objects.create(**{**self.person_data, "cpf": re.sub(r'[^0-9]', '', self.fake.cpf())})
+        items = [
+            {**self.person_data, "cpf": cpf},
+            {**self.person_data, "cpf": cpf},
+            {**self.person_data, "cpf": existing.cpf},
+            {**self.person_data, "cpf": self.fake.cpf(), "height": 3.0},
+        ]
+
+        response = self.client.post(url, items, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([item["status"] for item in response.data["results"]], [424, 424, 424, 400])
+        self.assertIn("height", response.data["results"][3]["errors"])
+        self.assertEqual(Person.objects.count(), 2)
+
+        response = self.client.post(url, items[:3], format='json')
+        self.assertEqual([item.get("errors") for item in response.data["results"]], [
+            None, {"cpf": ["CPF repetido no lote."]}, {"cpf": ["Já existe uma pessoa com este CPF."]}
+        ])
+
+    def test_bulk_update(self):
+        """Alteração em lote: uma consulta para carregar, um UPDATE e cache invalidado"""
+        other = Person.objects.create(**{**self.person_data, "cpf": self.fake.cpf()})
+        detail_url = reverse('person-detail', kwargs={'id': self.person.id})
+        self.client.get(detail_url)
+        items = [
+            {**self.person_data, "id": self.person.id, "name": "Lote A", "height": 1.70},
+            {**self.person_data, "id": other.id, "name": "Lote B", "cpf": other.cpf},
+        ]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(reverse('person-bulk-update'), items, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item["data"]["name"] for item in response.data["results"]], ["Lote A", "Lote B"])
+        detail = self.client.get(detail_url).data
+        self.assertEqual((detail["name"], detail["ideal_weight"]), ("Lote A", 65.59))
+
+        response = self.client.put(reverse('person-bulk-update'), [{**self.person_data, "id": 999999}], format='json')
+        self.assertEqual(response.data["results"][0]["errors"], {"id": ["Pessoa não encontrada."]})
+
+    def test_bulk_delete(self):
+        """Exclusão em lote: um DELETE, tombstones gravados e 404 para ids inexistentes"""
+        other = Person.objects.create(**{**self.person_data, "cpf": self.fake.cpf()})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('person-bulk-delete'), {"ids": [self.person.id, 999999, other.id]}, format='json'
+            )
+
+        self.assertEqual([item["status"] for item in response.data["results"]], [204, 404, 204])
+        self.assertFalse(Person.objects.exists())
+        self.assertEqual(
+            set(PersonTombstone.objects.values_list('person_id', flat=True)), {self.person.id, other.id}
+        )
+        self.assertEqual(self.client.get(self.url).data['results'], [])
+
+    def test_partial_update_writes_in_a_single_query(self):
+        """PATCH reaproveita a pessoa carregada e grava só os campos alterados"""
+        detail_url = reverse('person-detail', kwargs={'id': self.person.id})
+        self.client.get(detail_url)
+
+        with self.assertNumQueries(1) as queries:
+            response = self.client.patch(detail_url, {"name": "John Patch"}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('"cpf"', queries.captured_queries[0]['sql'])
+        self.person.refresh_from_db()
+        self.assertEqual((self.person.name, self.person.ideal_weight), ("John Patch", Decimal("72.86")))
+
+    def test_partial_update_metrics_use_stored_row(self):
+        """Métricas vêm da linha gravada, não das colunas não alteradas de uma pessoa antiga"""
+        Person.objects.filter(pk=self.person.pk).update(sex='F')
+        first, second = Person.objects.get(pk=self.person.pk), Person.objects.get(pk=self.person.pk)
+
+        PersonTask.update(first, {'height': Decimal('1.50')})
+        PersonTask.update(second, {'weight': Decimal('100.00')})
+
+        self.person.refresh_from_db()
+        expected = (Decimal('1.50'), Decimal('100.00'), Decimal('48.45'), Decimal('44.44'), Decimal('51.55'))
+        for person in (self.person, second):
+            self.assertEqual(
+                (person.height, person.weight, person.ideal_weight, person.bmi, person.weight_gap), expected
+            )
+
+    def test_update_with_if_match(self):
+        """If-Match com o ETag atual grava; com um ETag antigo, 412 sem gravar"""
+        detail_url = reverse('person-detail', kwargs={'id': self.person.id})
+        etag = self.client.get(detail_url)['ETag']
+
+        response = self.client.patch(detail_url, {"weight": 90}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['weight_gap'], 17.14)
+
+        response = self.client.patch(detail_url, {"name": "Atrasado"}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(Person.objects.get(pk=self.person.id).name, "John Doe")
+
+    def test_update_with_if_match_detects_concurrent_write(self):
+        """Uma gravação concorrente entre a leitura e o UPDATE também resulta em 412"""
+        detail_url = reverse('person-detail', kwargs={'id': self.person.id})
+        etag = self.client.get(detail_url)['ETag']
+        # Outro processo grava sem passar pelo cache (a versão em cache ainda bate com o ETag)
+        Person.objects.filter(pk=self.person.id).update(name="Concorrente", updated_at=timezone.now())
+
+        response = self.client.patch(detail_url, {"name": "Atrasado"}, format='json', HTTP_IF_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(Person.objects.get(pk=self.person.id).name, "Concorrente")
+
+    def test_retrieve_conditional_get(self):
+        """Detalhe com ETag/Last-Modified: 304 enquanto a pessoa não muda"""
+        detail_url = reverse('person-detail', kwargs={'id': self.person.id})
+        response = self.client.get(detail_url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        not_modified = self.client.get(detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(not_modified.content, b'')
+        weak = self.client.get(detail_url, HTTP_IF_NONE_MATCH=f"W/{etag}")
+        self.assertEqual(weak.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(
+            self.client.get(detail_url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code,
+            status.HTTP_304_NOT_MODIFIED
+        )
+
+        self.client.patch(detail_url, {"name": "John Changed"}, format='json')
+        changed = self.client.get(detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, status.HTTP_200_OK)
+        self.assertEqual(changed.data['name'], "John Changed")
+
+    def test_list_conditional_get(self):
+        """Listagem com ETag da versão da tabela: 304 até a próxima escrita"""
+        etag = self.client.get(self.url)['ETag']
+
+        with mock.patch('persons.views.PersonService.handle_search') as handle_search:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        handle_search.assert_not_called()
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertNotEqual(self.client.get(self.url, {'search': 'John'})['ETag'], etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Person.objects.create(**{**self.person_data, "cpf": self.fake.cpf()})
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIn('Last-Modified', response)
+
+    def test_fast_read_serializer_matches_person_serializer(self):
+        """O caminho rápido (values_list + orjson) gera os mesmos bytes do PersonSerializer + JSONRenderer"""
+        for name in ('José da Conceição', 'Aspas "duplas" \\ barra', 'Linha\u2028separada\u2029', 'Tab\tCtrl\x01 🙂'):
+            Person.objects.create(**{**self.person_data, "name": name, "cpf": self.fake.cpf(), "sex": "F", "height": 1.55})
+        people = Person.objects.order_by('id')
+
+        for formula in (None, FORMULAS['devine']):
+            expected = JSONRenderer().render(PersonSerializer(people, many=True, context={'formula': formula}).data)
+            fast = ORJSONRenderer().render(PersonReadSerializer(people.values_list(*PERSON_FIELDS), formula).data)
+            self.assertEqual(fast, expected)
+
+        created = PersonTask.bulk_create([{**self.person_data, "cpf": re.sub(r'[^0-9]', '', self.fake.cpf())}])
+        self.assertEqual(
+            ORJSONRenderer().render(PersonReadSerializer.from_instances(created).data),
+            JSONRenderer().render(PersonSerializer(created, many=True).data)
+        )
+
+        # Datas/horas com fuso (ex.: status das tasks) saem no formato do DRF, com `Z`
+        moment = {"at": timezone.now(), "day": timezone.now().date(), "progress": None}
+        self.assertEqual(ORJSONRenderer().render(moment), JSONRenderer().render(moment))
+        self.assertIn(b'Z"', ORJSONRenderer().render(moment))
+
+        # NaN/infinito são recusados como no JSONRenderer (STRICT_JSON), em vez de virar null
+        for value in (float('nan'), float('inf')):
+            with self.assertRaises(ValueError):
+                JSONRenderer().render({"results": [{"bmi": value}], "next": None})
+            with self.assertRaises(ValueError):
+                ORJSONRenderer().render({"results": [{"bmi": value}], "next": None})
+
+    def test_list_uses_fast_read_path(self):
+        """A listagem não instancia o Model nem passa pelo PersonSerializer"""
+        with mock.patch('persons.views.PersonSerializer') as serializer:
+            response = self.client.get(self.url)
+        serializer.assert_not_called()
+        self.assertEqual(response.data['results'][0]['height'], "1.80")
+        self.assertEqual(response.data['results'][0]['ideal_weight'], 72.86)
+
+    def test_sparse_fieldsets(self):
+        """`?fields=` devolve só os campos pedidos e o SELECT da listagem traz só essas colunas"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'fields': 'name,id,ideal_weight'})
+        self.assertEqual(list(response.data['results'][0]), ['id', 'name', 'ideal_weight'])
+        self.assertEqual(response.data['results'][0]['ideal_weight'], 72.86)
+        select = next(query['sql'] for query in queries if 'FROM "persons_person"' in query['sql'])
+        self.assertNotIn('"cpf"', select)
+        self.assertNotIn('"weight"', select)
+
+        # Com outra fórmula, as colunas de que ela depende são buscadas, mas não devolvidas
+        devine = self.client.get(self.url, {'fields': 'id,weight_gap', 'formula': 'devine'})
+        self.assertEqual(devine.data['results'][0], {
+            'id': self.person.id,
+            'weight_gap': float(Decimal('85.00') - FORMULAS['devine'].ideal_weight('M', Decimal('1.80'))),
+        })
+
+        detail = self.client.get(reverse('person-detail', kwargs={'id': self.person.id}), {'fields': 'id,name'})
+        self.assertEqual(detail.data, {'id': self.person.id, 'name': "John Doe"})
+
+        created = self.client.post(
+            reverse('person-bulk-create') + '?fields=id,cpf',
+            [{**self.person_data, "cpf": self.fake.cpf()}], format='json'
+        )
+        self.assertEqual(set(created.data['results'][0]['data']), {'id', 'cpf'})
+
+        invalid = self.client.get(self.url, {'fields': 'id,password'})
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('password', invalid.data['detail'])
+
+    def test_messagepack_and_compressed_responses(self):
+        """MessagePack negociado pelo Accept e compressão brotli/gzip pelo Accept-Encoding"""
+        for index in range(5):
+            Person.objects.create(**{**self.person_data, "cpf": self.fake.cpf()})
+        as_json = self.client.get(self.url)
+
+        packed = self.client.get(self.url, HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(packed['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(packed.content), json.loads(as_json.content))
+        self.assertLess(len(packed.content), len(as_json.content))
+        self.assertNotEqual(packed['ETag'], as_json['ETag'])
+        self.assertIn('Accept', packed['Vary'])
+        not_modified = self.client.get(self.url, HTTP_ACCEPT='application/msgpack', HTTP_IF_NONE_MATCH=packed['ETag'])
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        compressed = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+        self.assertEqual(compressed['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(compressed.content), as_json.content)
+        self.assertEqual(compressed['ETag'], f"W/{as_json['ETag']}")
+
+        gzipped = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(gzipped['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(gzipped.content), as_json.content)
+
+        # O ETag fraco da resposta comprimida vale para o If-Match
+        detail_url = reverse('person-detail', kwargs={'id': self.person.id})
+        etag = self.client.get(detail_url, HTTP_ACCEPT_ENCODING='br')['ETag']
+        response = self.client.patch(detail_url, {"name": "Comprimido"}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_retrieve_and_ideal_weight_use_person_cache(self):
+        """Detalhe e cálculo do peso ideal da mesma pessoa consultam o banco uma única vez"""
+        detail_url = reverse('person-detail', kwargs={'id': self.person.id})
+        ideal_url = reverse('person-calculate-ideal-weight', kwargs={'id': self.person.id})
+        self.client.get(detail_url)
+
+        with self.assertNumQueries(0):
+            detail = self.client.get(detail_url)
+            ideal = self.client.get(ideal_url)
+
+        self.assertEqual(detail.data['name'], "John Doe")
+        self.assertEqual(ideal.data['ideal_weight'], 72.86)
+
+    async def test_async_read_endpoints(self):
+        """Listagem, detalhe, peso ideal e status rodam como views async (ASGI)"""
+        self.assertTrue(PersonViewSet.view_is_async)
+        detail_url = reverse('person-detail', kwargs={'id': self.person.id})
+
+        listing = await self.async_client.get(self.url, {'fields': 'id,name'})
+        self.assertEqual(listing.json()['results'], [{'id': self.person.id, 'name': "John Doe"}])
+        detail = await self.async_client.get(detail_url)
+        self.assertEqual(detail.json()['cpf'], self.base_cpf)
+        not_modified = await self.async_client.get(detail_url, headers={'If-None-Match': detail['ETag']})
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        ideal = await self.async_client.get(reverse('person-calculate-ideal-weight', kwargs={'id': self.person.id}))
+        self.assertEqual(ideal.json()['ideal_weight'], 72.86)
+        missing = await self.async_client.get(reverse('person-detail', kwargs={'id': self.person.id + 1000}))
+        self.assertEqual(missing.status_code, status.HTTP_404_NOT_FOUND)
+
+        with mock.patch('persons.services.AsyncResult') as async_result:
+            async_result.return_value.status = "PENDING"
+            async_result.return_value.ready.return_value = False
+            response = await self.async_client.get(reverse('person-export-status', args=['abc']))
+        self.assertEqual(response.json()['status'], "PENDING")
+
+    async def test_async_person_cache_coalesces_misses(self):
+        """Misses simultâneos da mesma pessoa no caminho async viram uma única consulta"""
+        calls = []
+
+        async def loader():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return self.person
+
+        people = await asyncio.gather(*(aget_cached_person(self.person.id, loader) for _ in range(5)))
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(person.pk == self.person.pk for person in people))
+
+    def test_person_cache_refreshed_on_update_and_dropped_on_delete(self):
+        """Edição atualiza o cache da pessoa e a exclusão o descarta"""
+        detail_url = reverse('person-detail', kwargs={'id': self.person.id})
+        self.client.get(detail_url)
+
+        self.client.put(detail_url, {**self.person_data, "name": "John Smith"}, format='json')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(detail_url).data['name'], "John Smith")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(detail_url)
+        self.assertEqual(self.client.get(detail_url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_person_cache_coalesces_concurrent_misses(self):
+        """Enquanto outro processo busca a pessoa, o miss aguarda o valor em vez de consultar o banco"""
+        key = person_cache_key(self.person.id)
+        cache.add(f"{key}:lock", 1, 10)
+        threading.Timer(0.1, cache.set, args=(key, self.person)).start()
+        loader = mock.Mock()
+
+        person = get_cached_person(self.person.id, loader)
+
+        loader.assert_not_called()
+        self.assertEqual(person.pk, self.person.pk)
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class PersonImportTaskTests(TestCase):
+    def setUp(self):
+        self.fake = Faker('pt_BR')
+        self.header = "name,date_of_birth,cpf,sex,height,weight\n"
+
+    def run_import(self, content, **kwargs):
+        """Salva o CSV no storage (como faz o Service) e executa a task"""
+        file_path = default_storage.save("imports/teste.csv", ContentFile(content.encode('utf-8')))
+        return import_persons_from_csv(file_path, **kwargs)
+
+    def build_row(self, name, cpf, sex="M", height="1.80", weight="80.00"):
+        return f"{name},1990-01-01,{cpf},{sex},{height},{weight}\n"
+
+    def test_import_in_chunks(self):
+        """Garante que todas as linhas válidas são gravadas, mesmo divididas em vários lotes"""
+        rows = [self.build_row(f"Pessoa {i}", self.fake.cpf().replace('.', '').replace('-', '')) for i in range(5)]
+        result = self.run_import(self.header + "".join(rows), chunk_size=2)
+
+        self.assertEqual(result["created"], 5)
+        self.assertEqual(result["errors"], [])
+        self.assertEqual(Person.objects.count(), 5)
+
+    def test_import_reports_line_errors(self):
+        """Linhas inválidas são reportadas com o número da linha, sem impedir as demais"""
+        valid_cpf = self.fake.cpf().replace('.', '').replace('-', '')
+        content = self.header + self.build_row("Valida", valid_cpf) + self.build_row("Altura", "11122233344", height="3.00")
+        result = self.run_import(content, chunk_size=10)
+
+        self.assertEqual(result["created"], 1)
+        self.assertEqual(len(result["errors"]), 1)
+        self.assertTrue(result["errors"][0].startswith("Linha 2 (Altura)"))
+
+    def test_import_duplicate_cpf_in_database(self):
+        """Um CPF já cadastrado rejeita apenas a própria linha, e não o lote inteiro"""
+        existing_cpf = self.fake.cpf().replace('.', '').replace('-', '')
+        Person.objects.create(
+            name="Existente", date_of_birth="1980-01-01", cpf=existing_cpf,
+            sex="F", height=1.60, weight=55.00
+        )
+        new_cpf = self.fake.cpf().replace('.', '').replace('-', '')
+        content = self.header + self.build_row("Nova", new_cpf) + self.build_row("Repetida", existing_cpf)
+        result = self.run_import(content, chunk_size=10)
+
+        self.assertEqual(result["created"], 1)
+        self.assertEqual(len(result["errors"]), 1)
+        self.assertIn("Linha 2 (Repetida)", result["errors"][0])
+        self.assertEqual(Person.objects.count(), 2)
+
+    def test_import_duplicate_cpf_in_file(self):
+        """Um CPF repetido no próprio arquivo é rejeitado antes de chegar ao banco, mesmo em outro lote"""
+        cpf = self.fake.cpf()
+        content = self.header + self.build_row("Primeira", cpf.replace('.', '').replace('-', '')) + self.build_row("Segunda", f'"{cpf}"')
+        result = self.run_import(content, chunk_size=1)
+
+        self.assertEqual(result["created"], 1)
+        self.assertEqual(len(result["errors"]), 1)
+        self.assertIn("Linha 2 (Segunda)", result["errors"][0])
+        self.assertIn("CPF repetido no arquivo.", result["errors"][0])
+
+    def test_import_checks_existing_cpfs_with_single_query(self):
+        """A verificação de CPFs já cadastrados é feita com uma consulta por lote"""
+        rows = [self.build_row(f"Pessoa {i}", self.fake.cpf()) for i in range(4)]
+        content = self.header + "".join(rows)
+
+        # 1 SELECT (cpf IN ...) + SAVEPOINT/INSERT/RELEASE do bulk_create
+        with self.assertNumQueries(4):
+            result = self.run_import(content, chunk_size=10)
+
+        self.assertEqual(result["created"], 4)
+        self.assertEqual(Person.objects.filter(cpf__contains='.').count(), 0)
+
+    def test_import_upsert_mode_updates_existing(self):
+        """No modo upsert, CPFs já cadastrados são atualizados em vez de rejeitados"""
+        existing = Person.objects.create(
+            name="Antigo Nome", date_of_birth="1980-01-01", cpf="52998224725",
+            sex="F", height=1.60, weight=55.00
+        )
+        PersonTask.get_by_id(existing.id)
+        new_cpf = self.fake.cpf()
+        content = self.header + self.build_row("Novo Nome", "52998224725", weight="70.00") + self.build_row("Nova", new_cpf)
+        result = self.run_import(content, chunk_size=10, mode='upsert')
+
+        self.assertEqual((result["created"], result["updated"], result["skipped"]), (1, 1, 0))
+        self.assertEqual(result["errors"], [])
+        existing.refresh_from_db()
+        self.assertEqual(existing.name, "Novo Nome")
+        self.assertEqual(float(existing.weight), 70.00)
+        # O upsert em lote não dispara sinais, mas invalida o cache das pessoas
+        self.assertEqual(PersonTask.get_by_id(existing.id).name, "Novo Nome")
+
+    def test_import_skip_existing_mode(self):
+        """No modo skip-existing, CPFs já cadastrados são ignorados sem gerar erro"""
+        Person.objects.create(
+            name="Antigo Nome", date_of_birth="1980-01-01", cpf="52998224725",
+            sex="F", height=1.60, weight=55.00
+        )
+        content = self.header + self.build_row("Novo Nome", "52998224725") + self.build_row("Nova", self.fake.cpf())
+        result = self.run_import(content, chunk_size=10, mode='skip-existing')
+
+        self.assertEqual((result["created"], result["updated"], result["skipped"]), (1, 0, 1))
+        self.assertEqual(result["errors"], [])
+        self.assertEqual(Person.objects.get(cpf="52998224725").name, "Antigo Nome")
+
+    def test_import_endpoint_rejects_unknown_mode(self):
+        """O endpoint de importação recusa modos desconhecidos"""
+        upload = SimpleUploadedFile("pessoas.csv", self.header.encode('utf-8'), content_type="text/csv")
+        response = self.client.post(reverse('person-import-csv'), {'file': upload, 'mode': 'replace'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_import_removes_uploaded_file(self):
+        """O arquivo temporário do upload é removido do storage ao final da importação"""
+        file_path = default_storage.save("imports/teste.csv", ContentFile(self.header.encode('utf-8')))
+        import_persons_from_csv(file_path)
+        self.assertFalse(default_storage.exists(file_path))
+
+    def test_import_endpoint_rejects_non_utf8(self):
+        """Arquivos fora do padrão UTF-8 são recusados antes de chegar ao storage"""
+        upload = SimpleUploadedFile("pessoas.csv", "nome,cpf\nJosé,1\n".encode('latin-1'), content_type="text/csv")
+        response = self.client.post(reverse('person-import-csv'), {'file': upload})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(IMPORT_SHARD_SIZE=2)
+    def test_import_sharded_keeps_original_line_numbers(self):
+        """Arquivos grandes são divididos em shards, e os erros mantêm a numeração do arquivo original"""
+        rows = [self.build_row(f"Pessoa {i}", self.fake.cpf()) for i in range(4)]
+        rows.insert(3, self.build_row("Invalida", "11122233344"))
+        file_path = default_storage.save("imports/teste.csv", ContentFile((self.header + "".join(rows)).encode('utf-8')))
+
+        result = import_persons_from_csv.apply(args=[file_path], kwargs={'chunk_size': 10}).get()
+
+        self.assertEqual(result["created"], 4)
+        self.assertEqual(len(result["errors"]), 1)
+        self.assertTrue(result["errors"][0].startswith("Linha 4 (Invalida)"))
+        self.assertEqual(Person.objects.count(), 4)
+        self.assertEqual(default_storage.listdir("imports")[1], [])
+        self.assertTrue(default_storage.exists(result["error_file"]))
+        self.assertFalse([name for name in default_storage.listdir("reports")[1] if ".part" in name])
+
+    @override_settings(IMPORT_SHARD_SIZE=2)
+    def test_import_sharded_detects_cpf_repeated_across_shards(self):
+        """Um CPF repetido em shards diferentes é reportado como repetido no arquivo, em todos os modos"""
+        cpf = self.fake.cpf()
+        for mode in ("insert", "upsert", "skip-existing"):
+            with self.subTest(mode=mode):
+                Person.objects.all().delete()
+                rows = [self.build_row("Primeira", cpf)]
+                rows += [self.build_row(f"Pessoa {i}", self.fake.cpf()) for i in range(2)]
+                rows.append(self.build_row("Repetida", cpf.replace('.', '').replace('-', ''), weight="90.00"))
+                file_path = default_storage.save(
+                    "imports/teste.csv", ContentFile((self.header + "".join(rows)).encode('utf-8')))
+
+                result = import_persons_from_csv.apply(args=[file_path], kwargs={'mode': mode}).get()
+
+                self.assertEqual((result["created"], result["updated"], result["skipped"]), (3, 0, 0))
+                self.assertEqual(result["error_types"], {"cpf_repetido_arquivo": 1})
+                self.assertTrue(result["errors"][0].startswith("Linha 4 (Repetida)"))
+                self.assertEqual(Person.objects.get(name="Primeira").weight, Decimal("80.00"))
+
+
+    @override_settings(IMPORT_MAX_ERRORS=2)
+    def test_import_error_report_is_bounded(self):
+        """O resultado traz só os primeiros erros e as contagens por tipo; o relatório completo vai para um CSV"""
+        rows = [self.build_row(f"Invalida {i}", "11122233344") for i in range(3)]
+        rows.append(self.build_row("Alta", self.fake.cpf(), height="3.00"))
+        result = self.run_import(self.header + "".join(rows))
+
+        self.assertEqual(len(result["errors"]), 2)
+        self.assertEqual(result["error_count"], 4)
+        self.assertEqual(result["error_types"], {"cpf": 3, "height": 1})
+
+        with default_storage.open(result["error_file"], 'rb') as report:
+            lines = report.read().decode('utf-8').splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertTrue(lines[4].startswith("4,height,"))
+
+    def test_import_without_errors_has_no_report(self):
+        """Sem erros, nenhum relatório é gerado"""
+        result = self.run_import(self.header + self.build_row("Valida", self.fake.cpf()))
+        self.assertEqual(result["error_count"], 0)
+        self.assertIsNone(result["error_file"])
+
+    def test_import_with_copy_engine(self):
+        """O engine COPY produz os mesmos contadores e erros que o engine ORM"""
+        existing_cpf = self.fake.cpf()
+        Person.objects.create(
+            name="Existente", date_of_birth="1980-01-01", cpf=re.sub(r'[^0-9]', '', existing_cpf),
+            sex="F", height=1.60, weight=55.00
+        )
+        content = (
+            self.header
+            + self.build_row("Nova", self.fake.cpf())
+            + self.build_row("Repetida", existing_cpf)
+            + self.build_row("Invalida", "11122233344")
+        )
+        result = self.run_import(content, engine='copy')
+
+        self.assertEqual(result["created"], 1)
+        self.assertEqual(len(result["errors"]), 2)
+        self.assertTrue(result["errors"][0].startswith("Linha 2 (Repetida)"))
+        self.assertEqual(result["error_types"], {"cpf_duplicado": 1, "cpf": 1})
+        self.assertEqual(Person.objects.count(), 2)
+
+    def test_copy_engine_writes_per_row_timestamps(self):
+        """No engine COPY, cada linha recebe o próprio created_at/updated_at, na ordem do arquivo"""
+        content = self.header + ''.join(self.build_row(f"Pessoa {index}", self.fake.cpf()) for index in range(50))
+        self.run_import(content, engine='copy')
+
+        rows = list(Person.objects.order_by('id').values_list('created_at', 'updated_at'))
+        created = [created_at for created_at, _ in rows]
+        self.assertGreater(len(set(created)), 1)
+        self.assertEqual(created, sorted(created))
+        self.assertTrue(all(created_at == updated_at for created_at, updated_at in rows))
+
+    def test_import_stores_weight_metrics(self):
+        """As gravações em lote (ORM e COPY) também preenchem peso ideal, IMC e diferença"""
+        for engine in ('orm', 'copy'):
+            cpf = re.sub(r'[^0-9]', '', self.fake.cpf())
+            self.run_import(self.header + self.build_row(engine, cpf, sex="F", height="1.60", weight="70.00"), engine=engine)
+
+            person = Person.objects.get(cpf=cpf)
+            self.assertEqual(
+                (person.ideal_weight, person.bmi, person.weight_gap),
+                (Decimal("54.66"), Decimal("27.34"), Decimal("15.34"))
+            )
+
+    def test_import_invalidates_list_cache(self):
+        """A importação em lote (sem sinais do ORM) também troca a versão da listagem"""
+        version = person_list_version()
+        self.run_import(self.header + self.build_row("Fulano", self.fake.cpf()))
+        self.assertNotEqual(person_list_version(), version)
+
+    def test_import_upsert_with_copy_engine(self):
+        """No engine COPY, o upsert separa inseridos de atualizados pelo RETURNING"""
+        Person.objects.create(
+            name="Antigo Nome", date_of_birth="1980-01-01", cpf="52998224725",
+            sex="F", height=1.60, weight=55.00
+        )
+        content = self.header + self.build_row("Novo Nome", "52998224725") + self.build_row("Nova", self.fake.cpf())
+        result = self.run_import(content, mode='upsert', engine='copy')
+
+        self.assertEqual((result["created"], result["updated"], result["skipped"]), (1, 1, 0))
+        self.assertEqual(Person.objects.get(cpf="52998224725").name, "Novo Nome")
+
+class TaskProgressTests(TestCase):
+    def setUp(self):
+        self.task = mock.Mock()
+        self.progress = TaskProgress(self.task, f"teste-{uuid.uuid4().hex}")
+
+    def test_progress_snapshot_metrics(self):
+        """O andamento publicado traz linhas processadas, total, erros, vazão e ETA"""
+        self.progress.start(total=100)
+        self.progress.advance(40, errors=3)
+
+        snapshot = self.progress.snapshot()
+        self.assertEqual(snapshot["processed"], 40)
+        self.assertEqual(snapshot["total"], 100)
+        self.assertEqual(snapshot["errors"], 3)
+        self.assertGreater(snapshot["rows_per_sec"], 0)
+        self.assertIsNotNone(snapshot["eta_seconds"])
+
+    @override_settings(TASK_PROGRESS_INTERVAL=60)
+    def test_progress_publication_is_throttled(self):
+        """Dentro do intervalo configurado, apenas a primeira atualização é enviada ao Redis"""
+        progress = TaskProgress(self.task, self.progress.task_id)
+        progress.start(total=10)
+        for _ in range(5):
+            progress.advance(1)
+
+        self.assertEqual(self.task.update_state.call_count, 1)
+        self.assertEqual(self.task.update_state.call_args.kwargs["state"], "PROGRESS")
+
+    def test_import_status_exposes_progress(self):
+        """O endpoint de status repassa as métricas enquanto a task está em andamento"""
+        meta = {"processed": 10, "total": 20, "errors": 0, "rows_per_sec": 5.0, "eta_seconds": 2.0}
+        with mock.patch('persons.services.AsyncResult') as async_result:
+            async_result.return_value.status = "PROGRESS"
+            async_result.return_value.info = meta
+            async_result.return_value.ready.return_value = False
+            response = self.client.get(reverse('person-import-status', args=['abc']))
+
+        self.assertEqual(response.json()["progress"], meta)
+
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), EXPORT_CHUNK_SIZE=1)
+class PersonExportTaskTests(TestCase):
+    def setUp(self):
+        Person.objects.create(
+            name="Ana Souza", date_of_birth="1990-05-15", cpf="52998224725",
+            sex="F", height=1.60, weight=60.00
+        )
+        Person.objects.create(
+            name="Carlos Lima", date_of_birth="1985-01-20", cpf="11144477735",
+            sex="M", height=1.80, weight=85.50
+        )
+
+    def test_export_csv_content(self):
+        """A exportação em streaming gera o mesmo CSV de antes (inclusive o peso ideal)"""
+        result = export_persons_to_csv()
+
+        with default_storage.open(result["file_url"], 'rb') as exported:
+            lines = exported.read().decode('utf-8').splitlines()
+
+        self.assertEqual(lines, [
+            "Nome,Data de Nascimento,CPF,Sexo,Altura,Peso,Peso Ideal",
+            "Ana Souza,1990-05-15,52998224725,Feminino,1.60,60.00,54.66",
+            "Carlos Lima,1985-01-20,11144477735,Masculino,1.80,85.50,72.86",
+        ])
+
+    def test_export_csv_content_with_copy_engine(self):
+        """O engine COPY do PostgreSQL gera o mesmo CSV que o ORM, byte a byte"""
+        orm_result = export_persons_to_csv(engine='orm')
+        with default_storage.open(orm_result["file_url"], 'rb') as orm_file:
+            orm_content = orm_file.read()
+        default_storage.delete(orm_result["file_url"])
+
+        copy_result = export_persons_to_csv(engine='copy')
+        with default_storage.open(copy_result["file_url"], 'rb') as copy_file:
+            self.assertEqual(orm_content, copy_file.read())
+
+    def test_export_reuses_file_while_data_is_unchanged(self):
+        """Sem alterações na tabela, o endpoint devolve o arquivo existente sem iniciar outra exportação"""
+        result = export_persons_to_csv()
+
+        with mock.patch('persons.services.export_persons_to_csv.apply_async') as apply_async:
+            response = self.client.post(reverse('person-export-csv'))
+
+        apply_async.assert_not_called()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data["file_url"].endswith(result["file_url"]))
+
+    def test_export_ignores_file_still_being_written(self):
+        """Um arquivo com o nome do fingerprint, mas ainda sem a conclusão registrada, não é devolvido"""
+        fingerprint = PersonTask.export_fingerprint()
+        partial = default_storage.save(export_file_name(fingerprint), ContentFile(b"Nome,Data"))
+
+        with mock.patch('persons.services.export_persons_to_csv.apply_async') as apply_async:
+            response = self.client.post(reverse('person-export-csv'))
+        apply_async.assert_called_once()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        cache.delete(export_lock_key(fingerprint))
+
+        result = export_persons_to_csv(fingerprint=fingerprint)
+        self.assertNotEqual(result["file_url"], partial)
+        with default_storage.open(result["file_url"], 'rb') as exported:
+            self.assertEqual(len(exported.read().decode('utf-8').splitlines()), 3)
+
+    def test_export_fingerprint_changes_with_data(self):
+        """Qualquer alteração na tabela gera um novo fingerprint (e um novo arquivo)"""
+        before = PersonTask.export_fingerprint()
+        person = Person.objects.first()
+        person.weight = 70
+        person.save()
+
+        self.assertNotEqual(PersonTask.export_fingerprint(), before)
+        with mock.patch('persons.services.export_persons_to_csv.apply_async') as apply_async:
+            response = self.client.post(reverse('person-export-csv'))
+
+        apply_async.assert_called_once()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertIsNone(response.data["file_url"])
+        cache.delete(export_lock_key(PersonTask.export_fingerprint()))
+
+    def test_delta_export_since_checkpoint(self):
+        """A exportação incremental traz só o que mudou depois do checkpoint, inclusive exclusões"""
+        checkpoint = PersonTask.current_checkpoint()
+        ana = Person.objects.get(cpf="52998224725")
+        ana.weight = 58
+        ana.save()
+        Person.objects.get(cpf="11144477735").delete()
+
+        result = export_persons_delta_to_csv(checkpoint)
+
+        with default_storage.open(result["file_url"], 'rb') as exported:
+            rows = list(csv.reader(exported.read().decode('utf-8').splitlines()))
+
+        self.assertEqual([row[0] for row in rows[1:]], ["U", "D"])
+        self.assertEqual(rows[1][2], "Ana Souza")
+        self.assertEqual(rows[2][4], "11144477735")
+        self.assertNotEqual(result["next_checkpoint"], checkpoint)
+
+        # Nada mudou desde o novo checkpoint: o próximo delta vem vazio (só o cabeçalho)
+        next_result = export_persons_delta_to_csv(result["next_checkpoint"])
+        with default_storage.open(next_result["file_url"], 'rb') as exported:
+            self.assertEqual(len(exported.read().decode('utf-8').splitlines()), 1)
+        self.assertEqual(next_result["next_checkpoint"], result["next_checkpoint"])
+
+    def test_delta_export_interleaves_deletes_and_updates(self):
+        """CPF excluído e recriado no mesmo delta: o `D` vem antes do `U` do registro novo"""
+        checkpoint = PersonTask.current_checkpoint()
+        Person.objects.get(cpf="11144477735").delete()
+        Person.objects.create(
+            name="Carlos Lima", date_of_birth="1985-01-20", cpf="11144477735",
+            sex="M", height=1.80, weight=80.00
+        )
+
+        result = export_persons_delta_to_csv(checkpoint)
+        with default_storage.open(result["file_url"], 'rb') as exported:
+            rows = list(csv.reader(exported.read().decode('utf-8').splitlines()))
+
+        self.assertEqual([(row[0], row[4]) for row in rows[1:]], [("D", "11144477735"), ("U", "11144477735")])
+
+    def test_delta_export_accepts_old_checkpoint_format(self):
+        """Checkpoints antigos (`<updated_at>_<id>`) continuam aceitos"""
+        updated_at, person_id, _ = parse_checkpoint(PersonTask.current_checkpoint())
+        Person.objects.get(cpf="11144477735").delete()
+
+        result = export_persons_delta_to_csv(f"{updated_at.isoformat()}_{person_id}")
+        with default_storage.open(result["file_url"], 'rb') as exported:
+            rows = list(csv.reader(exported.read().decode('utf-8').splitlines()))
+        self.assertEqual([row[0] for row in rows[1:]], ["D"])
+
+    def test_export_rejects_invalid_checkpoint(self):
+        """Um checkpoint mal formado é recusado com 400"""
+        response = self.client.post(reverse('person-export-csv'), {'since': 'ontem'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_delta_export_rejects_non_csv_format(self):
+        """A exportação incremental só existe em CSV: `since` com outro formato é recusado com 400"""
+        with mock.patch('persons.services.export_persons_delta_to_csv.delay') as delay:
+            response = self.client.post(
+                reverse('person-export-csv'), {'since': PersonTask.current_checkpoint(), 'format': 'parquet'})
+
+        delay.assert_not_called()
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_gzip_csv_matches_plain_csv(self):
+        """O CSV comprimido com gzip tem o mesmo conteúdo do CSV simples"""
+        plain = export_persons_to_csv()
+        compressed = export_persons_to_csv(export_format='csv.gz')
+
+        self.assertTrue(compressed["file_url"].endswith(".csv.gz"))
+        with default_storage.open(plain["file_url"], 'rb') as plain_file, \
+                default_storage.open(compressed["file_url"], 'rb') as gzip_file:
+            self.assertEqual(gzip.decompress(gzip_file.read()), plain_file.read())
+
+    def test_export_json_lines(self):
+        """Cada linha do JSONL traz os mesmos campos da API"""
+        result = export_persons_to_csv(export_format='jsonl')
+
+        with default_storage.open(result["file_url"], 'rb') as exported:
+            records = [json.loads(line) for line in exported.read().decode('utf-8').splitlines()]
+
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0]["name"], "Ana Souza")
+        self.assertEqual(records[0]["height"], "1.60")
+        self.assertEqual(records[0]["ideal_weight"], 54.66)
+
+    def test_export_parquet(self):
+        """O Parquet é gravado por row groups, com o peso ideal calculado em lote"""
+        result = export_persons_to_csv(export_format='parquet')
+
+        with default_storage.open(result["file_url"], 'rb') as exported:
+            table = pq.read_table(io.BytesIO(exported.read()))
+
+        self.assertEqual(table.num_rows, 2)
+        self.assertEqual(table.column('ideal_weight').to_pylist(), [54.66, 72.86])
+
+    def test_export_rejects_unknown_format(self):
+        """Formatos desconhecidos são recusados com 400"""
+        response = self.client.post(reverse('person-export-csv'), {'format': 'xlsx'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
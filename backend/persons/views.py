@@ -1,41 +1,106 @@
-from rest_framework import viewsets, status
+from adrf import viewsets
+from asgiref.sync import sync_to_async
+from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
-from django.views.decorators.vary import vary_on_cookie
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.utils.cache import patch_vary_headers
 
+from .caching import aperson_list_state, person_list_cache_key
+from .conditional import (
+    etag_matches, is_not_modified, person_etag, person_list_etag, representation_etag, validator_headers
+)
+from .formulas import get_formula
 from .models import Person
-from .serializers import PersonSerializer
-from .services import PersonService
+from .pagination import (
+    PersonCursorPagination, PersonMetricCursorPagination, PersonRankedCursorPagination
+)
+from .renderers import PERSON_RENDERER_CLASSES
+from .serializers import (
+    IdealWeightBatchSerializer, PersonBulkDeleteSerializer, PersonReadSerializer, PersonSerializer,
+    parse_fields, person_read_columns
+)
+from .services import PersonService, StaleWriteError
 
 class PersonViewSet(viewsets.ViewSet):
     """
     Controller que gerencia as requisições REST para a entidade Pessoa.
     Segue a hierarquia: Controller -> Service -> Task.
+    Leituras baratas e consultas de status são async (ORM e cache async) e,
+    servidas por ASGI, não prendem uma thread enquanto aguardam o Redis ou o
+    banco; as demais operações continuam síncronas.
     """
     
     lookup_field = 'id'
+    renderer_classes = PERSON_RENDERER_CLASSES
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        # O formato (JSON ou MessagePack) é negociado pelo Accept
+        response = super().finalize_response(request, response, *args, **kwargs)
+        patch_vary_headers(response, ('Accept',))
+        return response
+
+    async def list(self, request):
+        # Páginas em cache num namespace versionado: qualquer escrita em Person
+        # troca a versão, então o TTL pode ser longo sem servir dados antigos.
+        # O ETag sai da mesma chave: se o cliente já tem a página, responde 304
+        # sem ler o cache nem serializar nada.
+        version, last_modified = await aperson_list_state()
+        cache_key = person_list_cache_key(request, version)
+        etag = representation_etag(person_list_etag(cache_key), request)
+        headers = validator_headers(etag, last_modified)
+        if is_not_modified(request, headers['ETag'], last_modified):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        data = await cache.aget(cache_key)
+        if data is not None:
+            return Response(data, headers=headers)
 
-    @method_decorator(cache_page(60))
-    @method_decorator(vary_on_cookie)
-    def list(self, request):
         search_query = request.query_params.get('search')
-        
-        people = PersonService.handle_search(filters={}, search_term=search_query)
-        
-        serializer = PersonSerializer(people, many=True)
-        return Response(serializer.data)
+        rank = bool(search_query) and request.query_params.get('rank') in ('1', 'true')
+        ordering = request.query_params.get('ordering')
+
+        try:
+            formula = get_formula(request.query_params.get('formula'))
+            fields = parse_fields(request.query_params.get('fields'))
+            filters = PersonService.parse_list_filters(request.query_params)
+            if rank:
+                paginator = PersonRankedCursorPagination()
+            elif ordering:
+                paginator = PersonMetricCursorPagination(ordering)
+            else:
+                paginator = PersonCursorPagination()
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        people = PersonService.handle_search(filters=filters, search_term=search_query, rank=rank)
+        # Com `fields`, o SELECT traz só as colunas pedidas (e as da ordenação)
+        rows = PersonService.get_read_rows(people, paginator.ordering, person_read_columns(fields, formula))
+        # A paginação do DRF avalia a consulta de forma síncrona
+        page = await sync_to_async(paginator.paginate_queryset)(rows, request, view=self)
+        data = paginator.get_paginated_response(PersonReadSerializer(page, formula, fields).data).data
+        await cache.aset(cache_key, data, settings.PERSON_LIST_CACHE_TTL)
+        return Response(data, headers=headers)
     
-    def retrieve(self, request, id=None):
+    async def retrieve(self, request, id=None):
         """
         Operação: Obter Detalhes
         """
         try:
+            formula = get_formula(request.query_params.get('formula'))
+            fields = parse_fields(request.query_params.get('fields'))
             # Controller chama Service
-            person = PersonService.get_person_by_id(id)
-            serializer = PersonSerializer(person)
-            return Response(serializer.data)
+            person = await PersonService.aget_person_by_id(id)
+            last_modified = person.updated_at.timestamp()
+            headers = validator_headers(representation_etag(person_etag(person), request), last_modified)
+            if is_not_modified(request, headers['ETag'], last_modified):
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+            serializer = PersonSerializer(person, context={'formula': formula}, fields=fields)
+            return Response(serializer.data, headers=headers)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Person.DoesNotExist:
             return Response(
                 {"detail": "Pessoa não encontrada."}, 
@@ -57,19 +122,146 @@ class PersonViewSet(viewsets.ViewSet):
         """
         Operação: Alterar
         """
+        return self._update(request, id, partial=False)
+
+    def partial_update(self, request, id=None):
+        """
+        Operação: Alterar parcialmente (PATCH), só com os campos enviados.
+        """
+        return self._update(request, id, partial=True)
+
+    def _update(self, request, id, partial):
+        """
+        A pessoa carregada aqui é a mesma gravada pelo Service (sem um segundo
+        SELECT). Com If-Match, a gravação só acontece se a pessoa ainda estiver
+        na versão do ETag informado; senão, 412.
+        """
         try:
             person_instance = PersonService.get_person_by_id(id)
         except Person.DoesNotExist:
             return Response({"detail": "Não encontrado"}, status=status.HTTP_404_NOT_FOUND)
 
-        serializer = PersonSerializer(instance=person_instance, data=request.data)
+        expected_updated_at = None
+        if_match = request.headers.get('If-Match')
+        if if_match is not None:
+            if not etag_matches(if_match, representation_etag(person_etag(person_instance), request), weak=True):
+                return self._precondition_failed()
+            expected_updated_at = person_instance.updated_at
+
+        serializer = PersonSerializer(instance=person_instance, data=request.data, partial=partial)
         
         if serializer.is_valid():
-            person = PersonService.handle_update(id, serializer.validated_data)
-            return Response(PersonSerializer(person).data)
+            try:
+                person = PersonService.handle_update(
+                    person_instance, serializer.validated_data, expected_updated_at
+                )
+            except StaleWriteError:
+                return self._precondition_failed()
+            return Response(
+                PersonSerializer(person).data, headers={'ETag': representation_etag(person_etag(person), request)}
+            )
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    def _precondition_failed(self):
+        return Response(
+            {"detail": "A pessoa foi alterada por outra requisição. Recarregue e tente novamente."},
+            status=status.HTTP_412_PRECONDITION_FAILED
+        )
+
+    def _bulk_validation_error(self, errors):
+        """
+        Resposta 400 de um lote inválido: nada é gravado. Itens com erro vêm
+        com status 400; os válidos, com 424 (não aplicados por causa dos outros).
+        """
+        if not isinstance(errors, list):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+        results = [
+            {"index": index, "status": status.HTTP_400_BAD_REQUEST, "errors": error}
+            if error else {"index": index, "status": status.HTTP_424_FAILED_DEPENDENCY}
+            for index, error in enumerate(errors)
+        ]
+        return Response({"results": results}, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['post'])
+    def bulk_create(self, request):
+        """
+        Operação: Incluir em lote.
+        Valida o array inteiro de uma vez e grava tudo numa única transação.
+        """
+        try:
+            fields = parse_fields(request.query_params.get('fields'))
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = PersonSerializer(data=request.data, many=True, max_length=settings.PERSON_BULK_MAX)
+        if not serializer.is_valid():
+            return self._bulk_validation_error(serializer.errors)
+
+        try:
+            people = PersonService.handle_bulk_create(serializer.validated_data)
+        except IntegrityError:
+            return Response({"detail": "Conflito de CPF com uma gravação concorrente."}, status=status.HTTP_409_CONFLICT)
+
+        people_data = PersonReadSerializer.from_instances(people, fields=fields).data
+        results = [
+            {"index": index, "id": person.pk, "status": status.HTTP_201_CREATED, "data": data}
+            for index, (person, data) in enumerate(zip(people, people_data))
+        ]
+        return Response({"results": results}, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['put'])
+    def bulk_update(self, request):
+        """
+        Operação: Alterar em lote.
+        Cada item traz o `id`; as pessoas são carregadas com uma única consulta.
+        """
+        try:
+            fields = parse_fields(request.query_params.get('fields'))
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        people = PersonService.get_people_for_bulk_update(request.data)
+        serializer = PersonSerializer(
+            instance=people, data=request.data, many=True, max_length=settings.PERSON_BULK_MAX
+        )
+        if not serializer.is_valid():
+            return self._bulk_validation_error(serializer.errors)
+
+        try:
+            people = PersonService.handle_bulk_update(people, serializer.validated_data)
+        except IntegrityError:
+            return Response({"detail": "Conflito de CPF com uma gravação concorrente."}, status=status.HTTP_409_CONFLICT)
+
+        people_data = PersonReadSerializer.from_instances(people, fields=fields).data
+        results = [
+            {"index": index, "id": person.pk, "status": status.HTTP_200_OK, "data": data}
+            for index, (person, data) in enumerate(zip(people, people_data))
+        ]
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'])
+    def bulk_delete(self, request):
+        """
+        Operação: Excluir em lote, com um único DELETE por `id`.
+        Ids inexistentes voltam com status 404.
+        """
+        serializer = PersonBulkDeleteSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        person_ids = serializer.validated_data['ids']
+        deleted = set(PersonService.handle_bulk_delete(person_ids))
+        results = [
+            {
+                "index": index,
+                "id": person_id,
+                "status": status.HTTP_204_NO_CONTENT if person_id in deleted else status.HTTP_404_NOT_FOUND,
+            }
+            for index, person_id in enumerate(person_ids)
+        ]
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
     def destroy(self, request, id=None):
         """
         Operação: Excluir
@@ -78,14 +270,34 @@ class PersonViewSet(viewsets.ViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=True, methods=['get'])
-    def calculate_ideal_weight(self, request, id=None):
+    async def calculate_ideal_weight(self, request, id=None):
         """
         Ponto Extra: Cálculo do peso ideal via Server. 
         Retorna o valor para ser exibido em um popup no Client.
         """
-        result = PersonService.get_ideal_weight_calculation(id)
+        try:
+            result = await PersonService.aget_ideal_weight_calculation(id, request.query_params.get('formula'))
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         return Response({'ideal_weight': result}, status=status.HTTP_200_OK)
 
+    @action(detail=False, methods=['post'])
+    def calculate_ideal_weight_batch(self, request):
+        """
+        Peso ideal em lote, para triagens: recebe `ids` (uma única consulta ao
+        banco) ou as listas `sex` e `height`, e responde em colunas.
+        """
+        serializer = IdealWeightBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.validated_data
+        if 'ids' in data:
+            result = PersonService.get_ideal_weight_batch(data['ids'], data['formula'])
+        else:
+            result = PersonService.calculate_ideal_weight_batch(data['sex'], data['height'], data['formula'])
+        return Response(result, status=status.HTTP_200_OK)
+
     @action(detail=False, methods=['post'])
     def import_csv(self, request):
         file = request.FILES.get('file')
@@ -93,24 +305,33 @@ class PersonViewSet(viewsets.ViewSet):
             return Response({"error": "Arquivo não fornecido"}, status=400)
         
         try:
-            task_id = PersonService.handle_import_csv(file)
+            mode = request.data.get('mode', 'insert')
+            task_id = PersonService.handle_import_csv(file, mode)
             return Response({"task_id": task_id, "message": "Importação iniciada."}, status=202)
         except ValueError as e:
             return Response({"error": str(e)}, status=400)
 
     @action(detail=False, methods=['get'], url_path='import-status/(?P<task_id>[^/.]+)')
-    def import_status(self, request, task_id=None):
-        status_data = PersonService.get_task_status(task_id)
+    async def import_status(self, request, task_id=None):
+        status_data = await PersonService.aget_task_status(task_id)
         return Response(status_data)
 
     @action(detail=False, methods=['post'])
     def export_csv(self, request):
-        """Dispara o processo de exportação"""
-        task_id = PersonService.handle_export_csv()
-        return Response({"task_id": task_id, "message": "Exportação iniciada."}, status=202)
+        """Dispara o processo de exportação (completa ou, com `since`, incremental)"""
+        try:
+            export = PersonService.handle_export_csv(
+                since=request.data.get('since'),
+                export_format=request.data.get('format', 'csv')
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        if export["file_url"]:
+            return Response({**export, "status": "SUCCESS", "message": "Exportação já disponível."})
+        return Response({**export, "message": "Exportação iniciada."}, status=202)
 
     @action(detail=False, methods=['get'], url_path='export-status/(?P<task_id>[^/.]+)')
-    def export_status(self, request, task_id=None):
+    async def export_status(self, request, task_id=None):
         """Retorna o status e, se pronto, o link do arquivo"""
-        status_data = PersonService.get_export_status(task_id)
+        status_data = await PersonService.aget_export_status(task_id)
         return Response(status_data)
@@ -17,6 +17,8 @@ export interface Person {
 export const usePersonStore = defineStore('person', () => {
   const persons = ref<Person[]>([])
   const loading = ref(false)
+  // Link da próxima página da listagem (paginação por cursor); null na última
+  const nextPage = ref<string | null>(null)
 
   const importStatus = ref({ loading: false, progress: 0, error: null as string | null })
   const exportStatus = ref({ loading: false, downloadUrl: null as string | null })
@@ -33,6 +35,22 @@ export const usePersonStore = defineStore('person', () => {
       // O backend espera ?search=... para filtrar nome ou CPF
       const response = await api.get(`/persons/?search=${search}`)
       persons.value = response.data.results || response.data
+      nextPage.value = response.data.next || null
+    } catch (error) {
+      console.error('Erro ao buscar pessoas:', error)
+    } finally {
+      loading.value = false
+    }
+  }
+
+  // Segue o `next` do cursor e acrescenta a página seguinte à lista
+  async function fetchMorePersons() {
+    if (!nextPage.value) return
+    loading.value = true
+    try {
+      const response = await api.get(nextPage.value)
+      persons.value.push(...response.data.results)
+      nextPage.value = response.data.next || null
     } catch (error) {
       console.error('Erro ao buscar pessoas:', error)
     } finally {
@@ -95,6 +113,13 @@ export const usePersonStore = defineStore('person', () => {
     exportStatus.value.loading = true
     try {
       const { data } = await api.post('/persons/export_csv/')
+      if (data.file_url) {
+        // Nada mudou desde a última exportação: o arquivo já está disponível
+        exportStatus.value.downloadUrl = data.file_url
+        exportStatus.value.loading = false
+        window.open(data.file_url, '_blank')
+        return
+      }
       pollExportStatus(data.task_id)
     } catch (error) {
       exportStatus.value.loading = false
@@ -159,6 +184,10 @@ export const usePersonStore = defineStore('person', () => {
         importStatus.value.loading = false
         alert('Erro crítico no servidor durante a importação.')
       } else {
+        // Andamento publicado pela task (linhas processadas / total)
+        if (data.progress && data.progress.total) {
+          importStatus.value.progress = Math.round((data.progress.processed / data.progress.total) * 100)
+        }
         setTimeout(() => pollImportStatus(taskId), 2000)
       }
     } catch (e) {
@@ -166,7 +195,7 @@ export const usePersonStore = defineStore('person', () => {
     }
   }
 
-  return { persons, loading, fetchPersons, deletePerson, savePerson, getIdealWeight,
+  return { persons, loading, nextPage, fetchPersons, fetchMorePersons, deletePerson, savePerson, getIdealWeight,
     importStatus, exportStatus, startExport, uploadCSV
    }
 })